@@ -20,6 +20,8 @@ from discord.ext.commands import Context
 from dotenv import load_dotenv
 
 from database import DatabaseManager
+from utils.ipc import IpcClient
+from utils.metrics import LoopLagMonitor, MetricsRegistry, MetricsServer
 
 if not os.path.isfile(f"{os.path.realpath(os.path.dirname(__file__))}/config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -36,6 +38,16 @@ https://discordpy.readthedocs.io/en/latest/intents.html#privileged-intents
 intents = discord.Intents.default()
 intents.message_content = True
 
+"""
+Sharding: set "sharded" in config.json to run every shard in this process, or start cluster.py,
+which runs several of these processes, each with its shards, cluster ID and IPC channel in the environment.
+"""
+
+CLUSTER_ID = int(os.environ["CLUSTER_ID"]) if "CLUSTER_ID" in os.environ else None
+SHARD_IDS = [int(shard_id) for shard_id in os.environ["SHARD_IDS"].split(",")] if os.environ.get("SHARD_IDS") else None
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else config.get("shard_count")
+BotBase = commands.AutoShardedBot if config.get("sharded", False) or SHARD_IDS else commands.Bot
+
 # Setup both of the loggers
 
 
@@ -77,7 +89,9 @@ logger.setLevel(logging.INFO)
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(LoggingFormatter())
 # File handler
-file_handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
+file_handler = logging.FileHandler(
+    filename="discord.log" if CLUSTER_ID is None else f"discord-cluster-{CLUSTER_ID}.log", encoding="utf-8", mode="w"
+)
 file_handler_formatter = logging.Formatter(
     "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
 )
@@ -88,12 +102,16 @@ logger.addHandler(console_handler)
 logger.addHandler(file_handler)
 
 
-class DiscordBot(commands.Bot):
+class DiscordBot(BotBase):
     def __init__(self) -> None:
+        shard_options = {}
+        if BotBase is commands.AutoShardedBot:
+            shard_options = {"shard_ids": SHARD_IDS, "shard_count": SHARD_COUNT}
         super().__init__(
             command_prefix=commands.when_mentioned_or(config["prefix"]),
             intents=intents,
             help_command=None,
+            **shard_options,
         )
         """
         This creates custom bot variables so that we can access these variables in cogs more easily.
@@ -106,6 +124,13 @@ class DiscordBot(commands.Bot):
         self.logger = logger
         self.config = config
         self.database = None
+        # set when running under cluster.py
+        self.cluster_id = CLUSTER_ID
+        self.ipc = None
+        # cogs register their own metrics in cog_load
+        self.metrics = MetricsRegistry(const_labels=None if CLUSTER_ID is None else {"cluster": str(CLUSTER_ID)})
+        self.metrics_server = None
+        self.loop_lag = LoopLagMonitor()
 
     async def init_db(self) -> None:
         async with aiosqlite.connect(
@@ -160,18 +185,102 @@ class DiscordBot(commands.Bot):
         )
 
         await self.init_db()
+        # the database is opened before the cogs are loaded so that they can use it in cog_load
+        connection = await aiosqlite.connect(
+            f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
+        )
+        if self.cluster_id is not None:
+            # the clusters share the database file, let their writes wait for each other instead of failing
+            await connection.execute("PRAGMA journal_mode=WAL")
+            await connection.execute("PRAGMA busy_timeout=5000")
+        self.database = DatabaseManager(connection=connection)
         self.logger.info("Database initialization complete.")
+        if self.cluster_id is not None:
+            self.ipc = IpcClient(
+                self.cluster_id,
+                int(os.environ["CLUSTER_IPC_PORT"]),
+                os.environ["CLUSTER_IPC_TOKEN"],
+                logger=self.logger,
+            )
+            self.ipc.register("stats", self.cluster_stats)
+            await self.ipc.connect()
+            self.logger.info(f"Connected to the cluster launcher as cluster {self.cluster_id} (shards {SHARD_IDS}).")
+        await self.start_metrics()
         self.logger.info("Start loading extensions.")
         await self.load_cogs()
         self.logger.info("extension loading complete.")
         self.status_task.start()
-        self.database = DatabaseManager(
-            connection=await aiosqlite.connect(
-                f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
-            )
-        )
         self.logger.info("Setup complete.")
 
+    async def start_metrics(self) -> None:
+        """
+        Registers the metrics of the bot itself and serves them all on http://metrics_host:metrics_port/metrics.
+        Every cluster listens on metrics_port plus its ID. A metrics_port of 0 disables the endpoint.
+        """
+        self.loop_lag.start()
+        self.metrics.gauge(
+            "discord_gateway_latency_seconds",
+            "The heartbeat latency of each shard.",
+            ["shard"],
+            callback=self._shard_latencies,
+        )
+        self.metrics.gauge(
+            "discord_event_loop_lag_seconds",
+            "How late the event loop last woke up from a one second sleep.",
+            callback=lambda: self.loop_lag.lag,
+        )
+        self.metrics.gauge(
+            "discord_event_loop_max_lag_seconds",
+            "The largest event loop lag since startup.",
+            callback=lambda: self.loop_lag.max_lag,
+        )
+        self.metrics.gauge("discord_guilds", "The guilds this process serves.", callback=lambda: len(self.guilds))
+        self.metrics.gauge(
+            "discord_voice_clients", "The connected voice clients.", callback=lambda: len(self.voice_clients)
+        )
+
+        port = self.config.get("metrics_port", 9464)
+        if not port:
+            return
+        self.metrics_server = MetricsServer(
+            self.metrics,
+            host=self.config.get("metrics_host", "127.0.0.1"),
+            port=port + (self.cluster_id or 0),
+            logger=self.logger,
+        )
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            # the bot works without its metrics
+            self.logger.error(f"Failed to start the metrics server: {e}")
+            self.metrics_server = None
+
+    def _shard_latencies(self) -> list[tuple[tuple[str], float]]:
+        if BotBase is commands.AutoShardedBot:
+            return [((str(shard_id),), latency) for shard_id, latency in self.latencies]
+        return [(("0",), self.latency)]
+
+    async def cluster_stats(self, args: dict) -> dict:
+        """
+        The statistics of this process, collected by the clusters command over IPC.
+
+        :param args: Unused.
+        """
+        return {
+            "shards": list(getattr(self, "shard_ids", None) or sorted(getattr(self, "shards", {})) or [0]),
+            "guilds": len(self.guilds),
+            "voice_clients": len(self.voice_clients),
+            "latency": self.latency if self.latency == self.latency else None,  # nan until connected
+        }
+
+    async def close(self) -> None:
+        if self.ipc is not None:
+            await self.ipc.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        self.loop_lag.close()
+        await super().close()
+
     async def on_message(self, message: discord.Message) -> None:
         """
         The code in this event is executed every time someone sends a message, with or without the prefix
@@ -0,0 +1,135 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sys
+
+import aiohttp
+from dotenv import load_dotenv
+
+from utils.ipc import IpcServer
+
+"""
+Runs the bot as several processes, each owning a contiguous range of the shards,
+so that gateway events, voice packet pacing and subprocess management scale with the cores.
+
+    python cluster.py
+
+The number of processes is cluster_count in config.json (default: one per core) and the number
+of shards is shard_count (default: the count recommended by Discord). The processes share the
+download cache on disk and talk to each other through a local IPC channel served from here.
+"""
+
+ROOT_DIR = os.path.realpath(os.path.dirname(__file__))
+# Discord allows one IDENTIFY per 5 seconds (with max_concurrency 1)
+IDENTIFY_INTERVAL = 5
+RESTART_DELAY = 10
+
+logging.basicConfig(format="[{asctime}] [{levelname:<8}] {name}: {message}", style="{", level=logging.INFO)
+logger = logging.getLogger("cluster")
+
+
+async def recommended_shard_count(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def split_shards(shard_count: int, cluster_count: int) -> list[list[int]]:
+    """
+    Splits the shard IDs into cluster_count contiguous ranges of (almost) the same size.
+    """
+    size, extra = divmod(shard_count, cluster_count)
+    ranges, start = [], 0
+    for cluster_id in range(cluster_count):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [shard_ids for shard_ids in ranges if shard_ids]
+
+
+class Cluster:
+    def __init__(self, cluster_id: int, shard_ids: list[int], shard_count: int, ipc: IpcServer) -> None:
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.ipc = ipc
+        self.process = None
+
+    async def start(self) -> None:
+        env = dict(
+            os.environ,
+            CLUSTER_ID=str(self.cluster_id),
+            SHARD_IDS=",".join(map(str, self.shard_ids)),
+            SHARD_COUNT=str(self.shard_count),
+            CLUSTER_IPC_PORT=str(self.ipc.port),
+            CLUSTER_IPC_TOKEN=self.ipc.token,
+        )
+        self.process = await asyncio.create_subprocess_exec(sys.executable, "bot.py", cwd=ROOT_DIR, env=env)
+        logger.info(f"Started cluster {self.cluster_id} (shards {self.shard_ids[0]}-{self.shard_ids[-1]}, pid {self.process.pid}).")
+
+    async def run(self, stopping: asyncio.Event) -> None:
+        """
+        Keeps the cluster running, restarting it if it exits without being told to.
+        """
+        while True:
+            await self.start()
+            returncode = await self.process.wait()
+            if stopping.is_set() or returncode == 0:
+                logger.info(f"Cluster {self.cluster_id} exited.")
+                return
+            logger.error(f"Cluster {self.cluster_id} exited with {returncode}, restarting in {RESTART_DELAY}s.")
+            await asyncio.sleep(RESTART_DELAY)
+
+
+async def main() -> None:
+    load_dotenv()
+    with open(os.path.join(ROOT_DIR, "config.json")) as file:
+        config = json.load(file)
+    token = os.getenv("TOKEN")
+
+    shard_count = config.get("shard_count") or await recommended_shard_count(token)
+    cluster_count = min(config.get("cluster_count") or os.cpu_count() or 1, shard_count)
+    logger.info(f"Running {shard_count} shards in {cluster_count} clusters.")
+
+    ipc = IpcServer(secrets.token_hex(16), port=config.get("cluster_ipc_port", 0), logger=logger)
+    await ipc.start()
+
+    stopping = asyncio.Event()
+    clusters = [
+        Cluster(cluster_id, shard_ids, shard_count, ipc)
+        for cluster_id, shard_ids in enumerate(split_shards(shard_count, cluster_count))
+    ]
+    runners = []
+    for cluster in clusters:
+        runners.append(asyncio.get_running_loop().create_task(cluster.run(stopping)))
+        # each cluster identifies its shards one after the other, do not let the next one overlap
+        await asyncio.sleep(IDENTIFY_INTERVAL * len(cluster.shard_ids))
+
+    try:
+        await asyncio.gather(*runners)
+    finally:
+        stopping.set()
+        for cluster in clusters:
+            if cluster.process is not None and cluster.process.returncode is None:
+                cluster.process.terminate()
+        await ipc.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -6,6 +6,8 @@ Version: 6.1.0
 Modified by z4kky - https://github.com/z4kkyy
 """
 
+import asyncio
+
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -16,6 +18,29 @@ class Owner(commands.Cog, name="owner"):
     def __init__(self, bot) -> None:
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        if self.bot.ipc is not None:
+            self.bot.ipc.register("reload", self._reload_cog)
+            self.bot.ipc.register("shutdown", self._shutdown)
+
+    async def cog_unload(self) -> None:
+        if self.bot.ipc is not None:
+            self.bot.ipc.unregister("reload")
+            self.bot.ipc.unregister("shutdown")
+
+    async def _reload_cog(self, args: dict) -> bool:
+        try:
+            await self.bot.reload_extension(f"cogs.{args['cog']}")
+        except Exception as e:
+            self.bot.logger.error(f"Could not reload the {args['cog']} cog: {e}")
+            return False
+        return True
+
+    async def _shutdown(self, args: dict) -> bool:
+        # closed a moment later so that the reply still reaches the cluster that asked
+        asyncio.get_running_loop().call_later(1, lambda: asyncio.ensure_future(self.bot.close()))
+        return True
+
     @commands.command(
         name="sync",
         description="Synchonizes the slash commands.",
@@ -156,6 +181,21 @@ class Owner(commands.Cog, name="owner"):
         :param context: The hybrid command context.
         :param cog: The name of the cog to reload.
         """
+        if self.bot.ipc is not None:
+            # every cluster runs its own copy of the cog
+            results = await self.bot.ipc.call("reload", cog=cog)
+            failed = sorted(cluster_id for cluster_id, reloaded in results.items() if not reloaded)
+            if failed or not results:
+                embed = discord.Embed(
+                    description=f"Could not reload the `{cog}` cog on clusters {', '.join(map(str, failed)) or 'all'}.",
+                    color=0xE02B2B,
+                )
+            else:
+                embed = discord.Embed(
+                    description=f"Successfully reloaded the `{cog}` cog on {len(results)} clusters.", color=0xBEBEFE
+                )
+            await context.send(embed=embed)
+            return
         try:
             await self.bot.reload_extension(f"cogs.{cog}")
         except Exception:
@@ -182,8 +222,47 @@ class Owner(commands.Cog, name="owner"):
         """
         embed = discord.Embed(description="Shutting down. Bye! :wave:", color=0xBEBEFE)
         await context.send(embed=embed)
+        if self.bot.ipc is not None:
+            # shuts down every cluster, this one included, and with them cluster.py
+            await self.bot.ipc.call("shutdown")
+            return
         await self.bot.close()
 
+    @commands.hybrid_command(
+        name="clusters",
+        description="Shows the shards, guilds and voice clients of every cluster.",
+    )
+    @commands.is_owner()
+    async def clusters(self, context: Context) -> None:
+        """
+        Shows the statistics of every cluster when running under cluster.py.
+
+        :param context: The hybrid command context.
+        """
+        if self.bot.ipc is None:
+            results = {0: await self.bot.cluster_stats({})}
+        else:
+            results = await self.bot.ipc.call("stats")
+        embed = discord.Embed(title="Clusters", color=0xBEBEFE)
+        for cluster_id, stats in sorted(results.items()):
+            if stats is None:
+                embed.add_field(name=f"Cluster {cluster_id}", value="No answer", inline=False)
+                continue
+            shards = stats["shards"]
+            latency = f"{stats['latency'] * 1000:.0f} ms" if stats["latency"] is not None else "-"
+            embed.add_field(
+                name=f"Cluster {cluster_id}" + (" (this one)" if cluster_id == self.bot.cluster_id else ""),
+                value=f"Shards {shards[0]}-{shards[-1]}, {stats['guilds']} guilds, "
+                f"{stats['voice_clients']} voice clients, latency {latency}",
+                inline=False,
+            )
+        totals = [stats for stats in results.values() if stats is not None]
+        embed.set_footer(
+            text=f"{sum(stats['guilds'] for stats in totals)} guilds and "
+            f"{sum(stats['voice_clients'] for stats in totals)} voice clients in {len(results)} clusters"
+        )
+        await context.send(embed=embed)
+
 
 async def setup(bot) -> None:
     await bot.add_cog(Owner(bot))
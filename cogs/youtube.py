@@ -7,15 +7,21 @@ Modified by z4kky - https://github.com/z4kkyy
 """
 
 import asyncio
+import importlib.util
+import itertools
+import json
+import math
 import os
+import random
 import re
 import subprocess
 import time
-from collections import defaultdict, deque
+from collections import deque
 # from datetime import datetime
-from typing import Union
+from typing import Awaitable, Callable, Coroutine, Union
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Context
 # from pydrive2.auth import GoogleAuth
@@ -29,6 +35,37 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 
+from utils import (
+    AdmissionController, AudioCache, BroadcastHub, BufferedOpusSource, DiskQuota, DownloadScheduler, FrameCache, MetadataStore, OggSeekIndex, OggSlice,
+    OpusFrameBuffer, PlaybackClock, RecordingSource, SearchCache, SessionStore, SingleFlight, TimerQueue, YtDlpProgress,
+    YtDlpResult, YtDlpWorkerPool
+)
+from utils.loudness import analyze_loudness, normalization_gain
+from utils.reaper import collect_orphan_files, kill_stray_processes, list_child_processes
+from utils.ytdlp import run_cli, run_cli_entries, structured_output_args
+
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([\w-]{11})(?![\w-])')
+URL_SEPARATOR_PATTERN = re.compile(r'[\s,]+')
+TRACK_END_GRACE = 30  # seconds a song may overrun its duration before it is considered stalled
+AUDIO_BYTES_PER_SECOND = 24000  # a generous estimate for opus and mp3 downloads, to reserve disk space
+QUEUE_PAGE_SIZE = 15  # songs per page of the queue command, well within the 4096 characters of an embed
+CHILD_PROCESS_COUNT_SECONDS = 15  # how often the ytdl_child_processes metric is refreshed
+# the metrics registered by _register_metrics, dropped again in cog_unload
+METRIC_NAMES = (
+    "ytdl_audio_cache_bytes",
+    "ytdl_audio_cache_hit_ratio",
+    "ytdl_audio_cache_lookups_total",
+    "ytdl_child_processes",
+    "ytdl_disk_used_bytes",
+    "ytdl_download_bytes",
+    "ytdl_download_queue_wait_seconds",
+    "ytdl_download_queue_waiting",
+    "ytdl_download_seconds",
+    "ytdl_players_playing",
+    "ytdl_queue_depth",
+    "ytdl_time_to_first_audio_seconds",
+)
+
 
 class AsyncioDequeQueue:
     def __init__(self):
@@ -49,19 +86,143 @@ class AsyncioDequeQueue:
         self.queue.append(item)
         self._get_event.set()
 
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def insert(self, index: int, item) -> None:
+        self.queue.insert(index, item)
+        self._get_event.set()
+
+    def remove_at(self, index: int):
+        item = self.queue[index]
+        del self.queue[index]
+        return item
+
+    def move(self, source: int, destination: int):
+        item = self.remove_at(source)
+        self.queue.insert(destination, item)
+        return item
+
+    def shuffle(self) -> None:
+        # in place, the deque may be being iterated by the prefetcher
+        items = list(self.queue)
+        random.shuffle(items)
+        self.queue.clear()
+        self.queue.extend(items)
+
+    def dedupe(self, key: Callable) -> list:
+        """
+        Removes the items whose key is already taken by an earlier item and returns them.
+
+        :param key: Returns the identity of an item.
+        """
+        seen, kept, removed = set(), [], []
+        for item in self.queue:
+            identity = key(item)
+            if identity in seen:
+                removed.append(item)
+            else:
+                seen.add(identity)
+                kept.append(item)
+        if removed:
+            self.queue.clear()
+            self.queue.extend(kept)
+        return removed
+
+    def page(self, start: int, count: int) -> list:
+        return list(itertools.islice(self.queue, start, start + count))
+
+
+class QueuePageView(discord.ui.View):
+    """
+    Previous and next buttons under a page of the queue command.
+    Every click renders the requested page again, so the queue may change in between.
+    """
+
+    def __init__(self, render: Callable[[int], tuple], page: int) -> None:
+        super().__init__(timeout=180)
+        self.render = render
+        self.page = page
+
+    async def _show(self, interaction: discord.Interaction, page: int) -> None:
+        embed, self.page = self.render(page)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.page + 1)
+
+
+class SearchResultView(discord.ui.View):
+    """
+    The select menu under the results of the search command. Only the member who searched can pick.
+    """
+
+    def __init__(
+        self, options: list[discord.SelectOption], author_id: int, on_select: Callable[[str], Awaitable]
+    ) -> None:
+        super().__init__(timeout=120)
+        self.author_id = author_id
+        self.on_select = on_select
+        self.select = discord.ui.Select(placeholder="Choose a song to add", options=options)
+        self.select.callback = self._selected
+        self.add_item(self.select)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author_id
+
+    async def _selected(self, interaction: discord.Interaction) -> None:
+        self.stop()
+        await interaction.response.edit_message(view=None)
+        await self.on_select(self.select.values[0])
+
+
+class GuildPlayer:
+    """
+    The playback state of one guild.
+    """
+
+    __slots__ = (
+        "guild_id", "queue", "voice_client", "if_playnow", "current_song_info", "loop_status",
+        "expected_disconnection", "clock", "play_next_lock", "playlist_task", "last_active", "text_channel_id",
+        "pending_song",
+    )
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id = guild_id
+        self.queue = AsyncioDequeQueue()
+        self.voice_client = None
+        self.if_playnow = False
+        self.current_song_info = None
+        self.loop_status = True
+        self.expected_disconnection = False
+        self.clock = PlaybackClock()
+        self.play_next_lock = asyncio.Lock()
+        self.playlist_task = None
+        self.last_active = time.monotonic()
+        # where the commands were last used, announcements after a restart go there
+        self.text_channel_id = None
+        # the song _play_next took from the queue and is waiting for, in neither the queue nor current_song_info
+        self.pending_song = None
+
+    @property
+    def is_idle(self) -> bool:
+        # a connected voice client is left to the idle timer, evicting it would leak the connection
+        if self.voice_client is not None and self.voice_client.is_connected():
+            return False
+        return self.current_song_info is None and self.pending_song is None and self.playlist_task is None
+
 
 # using yt-dlp (https://github.com/yt-dlp/yt-dlp)
 class YouTube(commands.Cog, name="youtube"):
     def __init__(self, bot) -> None:
         self.bot = bot
-        self.server_to_queue = defaultdict(AsyncioDequeQueue)
-        self.server_to_voice_client = defaultdict(lambda: None)
-        self.server_to_if_playnow = defaultdict(lambda: False)
-        self.server_to_current_song_info = defaultdict(lambda: None)
-        self.server_to_current_loop_status = defaultdict(lambda: True)
-        self.server_to_expected_disconnection = defaultdict(lambda: False)
-        self.server_to_timestamps = defaultdict(lambda: 0)
-        self.server_to_timestamp_task = defaultdict(lambda: None)
+        # guild_id -> GuildPlayer, only for guilds that used the bot recently
+        self.players: dict[int, GuildPlayer] = {}
 
         self.download_dir = os.path.join(os.getcwd(), "dldata/yt-dlp-download")
         self.video_download_dir = os.path.join(os.getcwd(), "dldata/yt-dlp-video-download")
@@ -73,58 +234,387 @@ class YouTube(commands.Cog, name="youtube"):
             with open(self.download_archive_path, "w") as _:
                 pass
 
+        # everything under dldata/: cached audio, videos waiting for their upload and partial downloads
+        self.quota = DiskQuota(
+            os.path.join(os.getcwd(), "dldata"),
+            max_bytes=self.bot.config.get("disk_quota_mb", 10240) * 2**20,
+            high_watermark=self.bot.config.get("disk_high_watermark", 0.9),
+            low_watermark=self.bot.config.get("disk_low_watermark", 0.75),
+            min_free_bytes=self.bot.config.get("disk_min_free_mb", 1024) * 2**20,
+            logger=self.bot.logger,
+        )
+        self.audio_cache = AudioCache(
+            max_bytes=self.bot.config.get("cache_max_mb", 2048) * 2**20,
+            policy=self.bot.config.get("cache_policy", "lru"),
+            database=self.bot.database,
+            logger=self.bot.logger,
+            # the clusters share dldata/, see _reap
+            pin_seconds=2 * self.bot.config.get("reaper_interval_minutes", 5) * 60 if self.bot.ipc is not None else 0,
+            quota=self.quota,
+        )
+        self.metadata = MetadataStore(
+            ttl=self.bot.config.get("metadata_ttl_hours", 24) * 3600,
+            database=self.bot.database,
+            # a cache hit skips yt-dlp, so nothing would refresh it
+            pinned=lambda video_id: video_id in self.audio_cache.entries,
+        )
+        self.download_scheduler = DownloadScheduler(self.bot.config.get("download_concurrency", 4))
+        # the encoded opus packets of looped songs, so that repeats need no ffmpeg process
+        self.frame_cache = FrameCache(self.bot.config.get("frame_cache_mb", 256) * 2**20)
+        self.broadcasts = BroadcastHub(ring_packets=self.bot.config.get("broadcast_join_window_seconds", 30) * 50)
+        self.loudness_semaphore = asyncio.Semaphore(self.bot.config.get("loudness_analysis_concurrency", 1))
+        # track end, prefetch and idle events of every guild
+        self.timers = TimerQueue(logger=self.bot.logger)
+        self.audio_flights = SingleFlight()
+        # flight key -> the priority of an audio download in flight, raised when a more urgent caller joins it
+        self.audio_priorities: dict[str, int] = {}
+        # downloads, resolutions, playlists and other work started in the background, cancelled in cog_unload
+        self.background_tasks: set[asyncio.Task] = set()
+        self.video_flights = SingleFlight()
+        self.search_cache = SearchCache(ttl=self.bot.config.get("search_cache_ttl_minutes", 60) * 60)
+        self.search_flights = SingleFlight()
+        self.search_semaphore = asyncio.Semaphore(self.bot.config.get("search_concurrency", 2))
+        self.admission = AdmissionController(
+            user_rate=self.bot.config.get("admission_user_rate_per_minute", 10) / 60,
+            user_burst=self.bot.config.get("admission_user_burst", 20),
+            guild_rate=self.bot.config.get("admission_guild_rate_per_minute", 30) / 60,
+            guild_burst=self.bot.config.get("admission_guild_burst", 60),
+            max_queue_length=self.bot.config.get("max_queue_length", 500),
+            max_track_seconds=self.bot.config.get("max_track_minutes", 180) * 60,
+            max_queued_seconds=self.bot.config.get("max_queued_hours", 24) * 3600,
+        )
+        # queues and positions, saved behind playback so that a restart resumes them
+        self.sessions = SessionStore(
+            self._session_row,
+            interval=self.bot.config.get("session_flush_seconds", 5),
+            database=self.bot.database,
+            logger=self.bot.logger,
+        )
+        # falls back to the yt-dlp CLI when the yt_dlp module is not installed
+        self.ytdlp_pool = None
+        if self.bot.config.get("ytdlp_workers", 2) > 0 and importlib.util.find_spec("yt_dlp") is not None:
+            self.ytdlp_pool = YtDlpWorkerPool(
+                size=self.bot.config.get("ytdlp_workers", 2),
+                max_jobs=self.bot.config.get("ytdlp_worker_max_jobs", 50),
+                max_rss_mb=self.bot.config.get("ytdlp_worker_max_rss_mb", 512),
+                logger=self.bot.logger,
+            )
+
         # gauth = GoogleAuth()
         # gauth.LocalWebserverAuth()
 
         # self.drive = GoogleDrive(gauth)
 
-    def _create_after_callback(self, guild_id: int, context: Context) -> callable:
+    async def cog_load(self) -> None:
+        self._register_metrics()
+        self.timers.start()
+        self.timers.schedule(("count_child_processes",), 0, self._count_child_processes)
+        self.timers.schedule(("evict_players",), 60, self._evict_idle_players)
+        await self.audio_cache.load()
+        await self.metadata.load()
+        # nothing is in flight yet, so anything the cache does not know about was left behind by a crash,
+        # unless other clusters are downloading into the same directory
+        await self._collect_orphan_files(
+            grace=self.bot.config.get("orphan_file_grace_minutes", 60) * 60 if self.bot.ipc is not None else 0
+        )
+        # the only full scan outside of the reaper, downloads and deletions are tracked as they happen
+        self.quota.replace(await asyncio.to_thread(DiskQuota.scan, self.quota.root))
+        await self._make_room()
+        self.timers.schedule(("reaper",), self.bot.config.get("reaper_interval_minutes", 5) * 60, self._reap)
+        # measure the files that were cached before their loudness was analyzed
+        for entry in list(self.audio_cache.entries.values()):
+            if entry.loudness is None:
+                self._spawn(self._analyze_loudness(entry.video_id))
+        if self.ytdlp_pool is not None:
+            await self.ytdlp_pool.start()
+        if self.bot.ipc is not None:
+            self.bot.ipc.register("ytstats", self._local_stats)
+        self.sessions.start()
+        self.timers.schedule(
+            ("checkpoint_sessions",), self.bot.config.get("session_checkpoint_seconds", 30), self._checkpoint_sessions
+        )
+        self._spawn(self._restore_sessions())
+
+    async def cog_unload(self) -> None:
+        if self.bot.ipc is not None:
+            self.bot.ipc.unregister("ytstats")
+        for name in METRIC_NAMES:
+            self.bot.metrics.unregister(name)
+        self.download_scheduler.on_wait = None
+        await self.timers.close()
+        # save the exact positions, then stop the songs so that their after callbacks,
+        # which still belong to this instance, do not move on in the queue
+        for guild_id in self.players:
+            self.sessions.mark(guild_id)
+        await self.sessions.close()
+        for player in self.players.values():
+            player.current_song_info = None
+            if player.voice_client is not None and player.voice_client.is_playing():
+                player.voice_client.stop()
+        # they would otherwise keep using the closed worker pool and timers of this instance
+        for task in list(self.background_tasks):
+            task.cancel()
+        if self.ytdlp_pool is not None:
+            await self.ytdlp_pool.close()
+
+    def _spawn(self, coroutine: Coroutine) -> asyncio.Task:
+        """
+        Runs a coroutine as a background task of the cog, cancelled when the cog is unloaded.
+
+        :param coroutine: The coroutine to run.
+        """
+        task = self.bot.loop.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def _register_metrics(self) -> None:
+        """
+        Registers the metrics of the player on the registry of the bot, served by its metrics endpoint.
+        The gauges are read at scrape time, the histograms are fed as things happen.
+        """
+        metrics = self.bot.metrics
+        self.download_seconds = metrics.histogram(
+            "ytdl_download_seconds",
+            "The time yt-dlp took to download a file, excluding the wait for a download slot.",
+            (1, 2, 5, 10, 20, 30, 60, 120, 300, 600),
+            ["kind"],
+        )
+        self.download_bytes = metrics.histogram(
+            "ytdl_download_bytes",
+            "The size of the downloaded files.",
+            tuple(2**20 * size for size in (1, 4, 16, 64, 256, 1024, 4096)),
+            ["kind"],
+        )
+        queue_wait = metrics.histogram(
+            "ytdl_download_queue_wait_seconds",
+            "The time downloads waited for a slot of the download scheduler.",
+            (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+        )
+        self.download_scheduler.on_wait = queue_wait.observe
+        self.first_audio_seconds = metrics.histogram(
+            "ytdl_time_to_first_audio_seconds",
+            "The time from a command to the start of its song, when it plays right away.",
+            (0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60),
+            ["command"],
+        )
+        self.cache_lookups = metrics.counter(
+            "ytdl_audio_cache_lookups_total", "The lookups of downloaded audio in the cache.", ["result"]
+        )
+        metrics.gauge(
+            "ytdl_audio_cache_hit_ratio",
+            "The fraction of the audio cache lookups that were hits.",
+            callback=self._cache_hit_ratio,
+        )
+        metrics.gauge(
+            "ytdl_audio_cache_bytes", "The size of the cached audio files.", callback=lambda: self.audio_cache.total_bytes
+        )
+        metrics.gauge(
+            "ytdl_disk_used_bytes", "The size of dldata/, reservations included.", callback=lambda: self.quota.used_bytes
+        )
+        metrics.gauge(
+            "ytdl_players_playing",
+            "The guilds where a song is playing.",
+            callback=lambda: sum(
+                1 for player in self.players.values()
+                if player.voice_client is not None and player.voice_client.is_playing()
+            ),
+        )
+        metrics.gauge(
+            "ytdl_queue_depth",
+            "The songs in the queue of each guild with a non-empty queue.",
+            ["guild"],
+            callback=lambda: [
+                ((str(guild_id),), len(player.queue)) for guild_id, player in self.players.items() if len(player.queue)
+            ],
+        )
+        metrics.gauge(
+            "ytdl_download_queue_waiting",
+            "The downloads waiting for a slot of the download scheduler.",
+            callback=lambda: self.download_scheduler.waiting,
+        )
+        self.child_process_counts = {"ffmpeg": 0, "yt-dlp": 0}
+        metrics.gauge(
+            "ytdl_child_processes", "The live child processes by name.", ["name"], callback=self._child_processes
+        )
+
+    def _cache_hit_ratio(self) -> float:
+        hits = self.cache_lookups.values.get(("hit",), 0)
+        lookups = hits + self.cache_lookups.values.get(("miss",), 0)
+        return hits / lookups if lookups else math.nan
+
+    def _child_processes(self) -> list[tuple[tuple[str], int]]:
+        counts = {**self.child_process_counts, "yt-dlp-worker": len(self.ytdlp_pool.pids) if self.ytdlp_pool else 0}
+        return [((name,), count) for name, count in counts.items()]
+
+    async def _count_child_processes(self) -> None:
+        # listing /proc reads every process of the host, keep it off the event loop and out of the scrapes
+        try:
+            counts = {"ffmpeg": 0, "yt-dlp": 0}
+            for _, name, _ in await asyncio.to_thread(list_child_processes, ("ffmpeg", "yt-dlp")):
+                counts[name] += 1
+            self.child_process_counts = counts
+        finally:
+            self.timers.schedule(("count_child_processes",), CHILD_PROCESS_COUNT_SECONDS, self._count_child_processes)
+
+    async def cog_before_invoke(self, context: Context) -> None:
+        if context.guild is not None:
+            self._player(context.guild.id).text_channel_id = context.channel.id
+
+    def _player(self, guild_id: int) -> GuildPlayer:
+        """
+        Returns the player of a guild, creating it if needed, and marks it as active.
+
+        :param guild_id: The ID of the guild.
+        """
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        player.last_active = time.monotonic()
+        return player
+
+    async def _evict_idle_players(self) -> None:
+        """
+        Drops the players that have been idle for longer than player_idle_ttl_minutes,
+        releasing their queued files and timers, then schedules the next sweep.
+        """
+        ttl = self.bot.config.get("player_idle_ttl_minutes", 30) * 60
+        try:
+            now = time.monotonic()
+            for guild_id, player in list(self.players.items()):
+                if now - player.last_active < ttl or not player.is_idle:
+                    continue
+                for song_info in player.queue.queue:
+                    self._release_song(song_info)
+                for event in ("prefetch", "track_end", "idle"):
+                    self.timers.cancel((event, guild_id))
+                del self.players[guild_id]
+                self.sessions.mark(guild_id)
+                self.bot.logger.info(f"Evicted the idle player. (guild id: {guild_id})")
+            self.admission.prune()
+        finally:
+            self.timers.schedule(("evict_players",), max(ttl / 2, 60), self._evict_idle_players)
+
+    async def _reap(self) -> None:
+        """
+        Disconnects idle voice clients, kills stray ffmpeg and yt-dlp processes and deletes orphan files,
+        then schedules the next run.
+        """
+        try:
+            idle = self.bot.config.get("idle_disconnect_minutes", 10) * 60
+            now = time.monotonic()
+            for voice_client in list(self.bot.voice_clients) if idle > 0 else []:
+                player = self.players.get(voice_client.guild.id)
+                if voice_client.is_playing():
+                    continue
+                if player is not None and (
+                    player.current_song_info or player.pending_song or now - player.last_active < idle
+                ):
+                    continue
+                self.bot.logger.info(f"[Reaper] Leaving an idle voice channel. (guild id: {voice_client.guild.id})")
+                if player is not None:
+                    player.expected_disconnection = True
+                    player.if_playnow = False
+                    player.voice_client = None
+                await voice_client.disconnect(force=True)
+
+            await asyncio.to_thread(
+                kill_stray_processes,
+                ("ffmpeg", "yt-dlp"),
+                self._live_process_ids(),
+                self.bot.config.get("reaper_process_min_age_minutes", 15) * 60,
+                self.bot.logger,
+            )
+            if self.bot.ipc is not None:
+                # the players change on the event loop, only the frozen set of paths goes to the thread
+                await asyncio.to_thread(self._touch_files, frozenset(self._paths_in_use()))
+            await self._collect_orphan_files(grace=self.bot.config.get("orphan_file_grace_minutes", 60) * 60)
+            # resync with the disk, which the orphan collection and other clusters change behind the quota's back
+            if self.quota.retry_deletes():
+                self.bot.logger.warning(f"[Reaper] {len(self.quota.leaked)} files still cannot be deleted.")
+            self.quota.replace(await asyncio.to_thread(DiskQuota.scan, self.quota.root))
+            await self._make_room()
+        finally:
+            self.timers.schedule(("reaper",), self.bot.config.get("reaper_interval_minutes", 5) * 60, self._reap)
+
+    @staticmethod
+    def _touch_files(paths: frozenset[str]) -> None:
+        # the other clusters only see the cache on disk: a recent mtime keeps their
+        # AudioCache (pin_seconds) and orphan collection (grace) off the files playing here
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _paths_in_use(self) -> set[str]:
+        paths = set()
+        for player in self.players.values():
+            for song_info in (player.current_song_info, player.pending_song, *player.queue.queue):
+                if song_info and song_info.get('path'):
+                    paths.add(os.path.realpath(song_info['path']))
+        return paths
+
+    def _live_process_ids(self) -> set[int]:
+        # the ffmpeg processes behind the broadcasts that are still playing
+        pids = set()
+        for source in self.broadcasts.sources():
+            source = getattr(source, "source", source)  # unwrap RecordingSource
+            process = getattr(source, "_process", None)
+            if process:
+                pids.add(process.pid)
+        return pids
+
+    async def _collect_orphan_files(self, grace: float) -> None:
+        """
+        Deletes the downloaded files that neither the cache nor any queue references.
+
+        :param grace: The minimum age in seconds of an orphan file.
+        """
+        referenced = {os.path.realpath(entry.path) for entry in self.audio_cache.entries.values()}
+        referenced |= self._paths_in_use()
+        if self.bot.ipc is not None:
+            # the files the other clusters cached since this one loaded the index
+            referenced |= {os.path.realpath(row[1]) for row in await self.bot.database.get_cache_entries()}
+        directories = [self.download_dir]
+        if not len(self.video_flights):
+            # a video is only deleted once its upload, which can take long, has finished
+            directories.append(self.video_download_dir)
+        deleted, freed = await asyncio.to_thread(collect_orphan_files, directories, referenced, grace, self.bot.logger)
+        if deleted:
+            self.bot.logger.info(f"[Reaper] Deleted {deleted} orphan files ({freed / 2**20:.1f} MiB).")
+
+    def _create_after_callback(self, guild_id: int, context: Context, song_info: dict) -> callable:
         def after_callback(error):
             async def play_again():
                 if error:
                     self.bot.logger.error(f"Failed to play the audio: {error}")
 
-                if self.server_to_current_loop_status[guild_id]:
+                player = self.players.get(guild_id)
+                # playnow, skip and stop replace the current song themselves
+                if player is None or player.current_song_info is not song_info:
+                    return
+                # an unexpected disconnection is resumed by on_voice_state_update
+                if player.voice_client is None or not player.voice_client.is_connected():
+                    return
+
+                if player.loop_status:
                     self.bot.logger.info(f"Loop status is True. Playing again. (guild id: {guild_id})")
-                    file_path = self.server_to_current_song_info[guild_id]['path']
-                    ffmpeg_options = {
-                        "options": "-af 'volume=0.1' -vn -ac 2",
-                        "stderr": subprocess.DEVNULL,
-                    }
-                    self.server_to_voice_client[guild_id].play(
-                        discord.FFmpegPCMAudio(file_path, **ffmpeg_options),
-                        after=self._create_after_callback(guild_id, context)
+                    player.voice_client.play(
+                        self._create_audio_source(song_info, record=True),
+                        after=self._create_after_callback(guild_id, context, song_info)
                     )
-                    self.server_to_current_song_info[guild_id]['start_time'] = discord.utils.utcnow()
-                    self.bot.loop.create_task(self._start_timestamp_tracking(guild_id))
-                elif self.server_to_queue[guild_id].queue:
+                    self._start_clock(guild_id)
+                elif player.queue.queue:
                     self.bot.logger.info(f"Queue is not empty. Playing next song. (guild id: {guild_id})")
-                    # delete the file
-                    current_song = self.server_to_current_song_info[guild_id]
-                    if current_song:
-                        try:
-                            os.remove(current_song['path'])
-                        except OSError:
-                            pass
                     await self._play_next(guild_id, context)
                 else:
-                    current_song = self.server_to_current_song_info[guild_id]
-                    if current_song:
-                        try:
-                            os.remove(current_song['path'])
-                        except OSError:
-                            pass
                     self.bot.logger.info(f"Loop is off and queue is empty. Stopping playback. (guild id: {guild_id})")
-                    self.server_to_if_playnow[guild_id] = False
-                    self.server_to_current_song_info[guild_id] = None
-                    self.server_to_timestamps[guild_id] = 0
-                    # delete the file
-                    current_song = self.server_to_current_song_info[guild_id]
-                    if current_song:
-                        try:
-                            os.remove(current_song['path'])
-                        except OSError:
-                            pass
+                    # release the file so that the cache can evict it
+                    self._release_song(song_info)
+                    player.if_playnow = False
+                    player.current_song_info = None
+                    self._stop_clock(guild_id)
                     if context:
                         embed = discord.Embed(
                             description="Playback finished. The queue is now empty.", color=0xE02B2B
@@ -134,24 +624,321 @@ class YouTube(commands.Cog, name="youtube"):
             asyncio.run_coroutine_threadsafe(play_again(), self.bot.loop)
         return after_callback
 
-    async def _update_timestamp(self, guild_id: int) -> None:
-        if guild_id in self.server_to_current_song_info:
-            current_song = self.server_to_current_song_info[guild_id]
-            if current_song is not None and "start_time" in current_song:
-                elapsed = (discord.utils.utcnow() - current_song["start_time"]).total_seconds()
-                self.server_to_timestamps[guild_id] = elapsed
+    def _release_song(self, song_info: Union[dict, None]) -> None:
+        """
+        Drops the cache reference held by a current or queued song. Safe to call twice.
+
+        :param song_info: The song info dict, or None.
+        """
+        if not song_info:
+            return
+        if song_info.get('state') in ('pending', 'streaming'):
+            # the download task drops the reference as soon as it finishes
+            song_info['state'] = 'released'
+        if song_info.pop('acquired', False):
+            self.audio_cache.release(song_info['id'])
+
+    def _release_pending_song(self, player: GuildPlayer) -> None:
+        # _play_next notices that its song is gone and gives up on it
+        self._release_song(player.pending_song)
+        player.pending_song = None
+
+    async def _resolve_song(self, song_info: dict, priority: int = DownloadScheduler.BACKGROUND) -> None:
+        """
+        Downloads a queued song and marks it as ready (or failed).
+
+        :param song_info: The song info dict of the queued song.
+        :param priority: The download scheduler priority.
+        """
+        result = await self._fetch_audio(song_info['url'], song_info['guild_id'], song_info['requester'], priority)
+        if result is None:
+            if song_info['state'] == 'pending':
+                song_info['state'] = 'failed'
+            return
+        song_info['id'], song_info['path'] = result
+        if song_info['state'] == 'released':
+            self.audio_cache.release(song_info['id'])
+            return
+        song_info['acquired'] = True
+        song_info['state'] = 'ready'
+
+    async def _open_song(self, url: str, guild_id: int, user_id: int) -> Union[dict, None]:
+        """
+        Returns a playable song info dict for playnow.
+        On a cache miss in streaming mode, the song plays from the resolved stream url
+        while the file is downloaded into the cache in the background.
+
+        :param url: The url to the YouTube video.
+        :param guild_id: The ID of the guild.
+        :param user_id: The ID of the member who requested the song.
+        """
+        song_info = {'url': url, 'guild_id': guild_id, 'requester': user_id}
+        video_id = self._extract_video_id(url)
+        if video_id is not None and video_id in self.audio_cache:
+            result = await self._fetch_audio(url, guild_id, user_id, DownloadScheduler.INTERACTIVE)
+            if result is not None:
+                song_info.update(id=result[0], path=result[1], state='ready', acquired=True)
+                return song_info
+
+        if self.bot.config.get("streaming", True):
+            async with self.download_scheduler.slot(guild_id, user_id, DownloadScheduler.INTERACTIVE):
+                stream = await self._resolve_stream_url(url)
+            if stream is not None:
+                await self._remember_metadata(stream)
+                song_info.update(id=stream.id, path=None, stream_codec=stream.codec, stream_url=stream.url, state='streaming')
+                self._spawn(self._fill_stream_cache(song_info))
+                return song_info
+
+        result = await self._fetch_audio(url, guild_id, user_id, DownloadScheduler.INTERACTIVE)
+        if result is None:
+            return None
+        song_info.update(id=result[0], path=result[1], state='ready', acquired=True)
+        return song_info
+
+    async def _fill_stream_cache(self, song_info: dict) -> None:
+        """
+        Downloads a streamed song into the cache so that loops and replays use the local file.
+
+        :param song_info: The song info dict of the streamed song.
+        """
+        result = await self._fetch_audio(song_info['url'], song_info['guild_id'], song_info['requester'])
+        if result is None:
+            if song_info['state'] == 'streaming':
+                song_info['state'] = 'ready'  # keep streaming, there is nothing else to wait for
+            return
+        if song_info['state'] == 'released':
+            self.audio_cache.release(result[0])
+            return
+        song_info['id'], song_info['path'] = result
+        song_info['acquired'] = True
+        song_info['state'] = 'ready'
+
+    def _ensure_resolving(self, song_info: dict, priority: int = DownloadScheduler.BACKGROUND) -> asyncio.Task:
+        task = song_info.get('task')
+        if task is None:
+            task = self._spawn(self._resolve_song(song_info, priority))
+            song_info['task'] = task
+        return task
+
+    def _schedule_prefetch(self, guild_id: int) -> None:
+        """
+        Starts downloading the next few queued songs in the background.
+
+        :param guild_id: The ID of the guild.
+        """
+        player = self.players.get(guild_id)
+        if player is None:
+            return
+        depth = self.bot.config.get("prefetch_depth", 3)
+        for song_info in itertools.islice(player.queue.queue, depth):
+            if song_info['state'] == 'pending':
+                self._ensure_resolving(song_info)
+
+    @staticmethod
+    def _extract_video_id(url: str) -> Union[str, None]:
+        match = YOUTUBE_ID_PATTERN.search(url)
+        return match.group(1) if match else None
+
+    def _start_clock(self, guild_id: int, position: float = 0.0) -> None:
+        """
+        Starts the playback clock of a guild and schedules the prefetch and track end timers of its current song.
+
+        :param guild_id: The ID of the guild.
+        :param position: The position playback starts from, in seconds.
+        """
+        player = self._player(guild_id)
+        player.clock.start(position)
+        self.sessions.mark(guild_id)
+        self.timers.cancel(("idle", guild_id))
+        song_info = player.current_song_info
+        duration = self._song_duration(song_info) if song_info else None
+        if not duration:
+            self.timers.cancel(("prefetch", guild_id))
+            self.timers.cancel(("track_end", guild_id))
+            return
+        remaining = max(duration - position, 0)
+        lead = self.bot.config.get("prefetch_lead_seconds", 30)
+        self.timers.schedule(("prefetch", guild_id), max(remaining - lead, 0), lambda: self._on_prefetch_timer(guild_id))
+        self.timers.schedule(
+            ("track_end", guild_id), remaining + TRACK_END_GRACE, lambda: self._on_track_end_timer(guild_id, song_info)
+        )
+
+    def _stop_clock(self, guild_id: int) -> None:
+        """
+        Stops the playback clock of a guild and schedules its idle disconnection.
 
-    async def _start_timestamp_tracking(self, guild_id: int) -> None:
+        :param guild_id: The ID of the guild.
+        """
+        player = self._player(guild_id)
+        player.clock.stop()
+        self.sessions.mark(guild_id)
+        self.timers.cancel(("prefetch", guild_id))
+        self.timers.cancel(("track_end", guild_id))
+        idle_minutes = self.bot.config.get("idle_disconnect_minutes", 10)
+        if idle_minutes > 0:
+            self.timers.schedule(("idle", guild_id), idle_minutes * 60, lambda: self._on_idle_timer(guild_id))
+
+    async def _on_prefetch_timer(self, guild_id: int) -> None:
+        # the next songs may have been evicted or failed since they were queued
+        self._schedule_prefetch(guild_id)
+
+    async def _on_track_end_timer(self, guild_id: int, song_info: dict) -> None:
+        """
+        Stops a song that is still playing well past its duration, e.g. because its stream stalled,
+        so that the after callback moves on.
+        """
+        player = self.players.get(guild_id)
+        if player is None or player.current_song_info is not song_info or player.voice_client is None:
+            return
+        voice_client = player.voice_client
+        if voice_client.is_playing():
+            self.bot.logger.warning(f"Playback overran the song duration, stopping it. (guild id: {guild_id})")
+            voice_client.stop()
+
+    async def _on_idle_timer(self, guild_id: int) -> None:
+        player = self.players.get(guild_id)
+        if player is None or player.voice_client is None:
+            return
+        voice_client = player.voice_client
+        if voice_client.is_playing() or player.current_song_info:
+            return
+        self.bot.logger.info(f"Leaving the voice channel after being idle. (guild id: {guild_id})")
+        player.expected_disconnection = True
+        player.if_playnow = False
+        await voice_client.disconnect()
+        player.voice_client = None
+
+    @staticmethod
+    def _persisted_song(song_info: dict) -> dict:
+        # paths and download states are not worth saving, the cache resolves the id again
+        return {'url': song_info['url'], 'id': song_info.get('id'), 'requester': song_info.get('requester')}
+
+    def _session_row(self, guild_id: int) -> Union[tuple, None]:
+        """
+        Returns the row SessionStore saves for a guild, or None when there is nothing to resume.
+
+        :param guild_id: The ID of the guild.
+        """
+        player = self.players.get(guild_id)
+        if player is None or player.voice_client is None:
+            return None
+        current = player.current_song_info
+        # the song _play_next is waiting for is still the head of the queue
+        queue = ([player.pending_song] if player.pending_song else []) + list(player.queue.queue)
+        if current is None and not queue:
+            return None
+        return (
+            guild_id,
+            player.voice_client.channel.id,
+            player.text_channel_id,
+            json.dumps(self._persisted_song(current)) if current else None,
+            player.clock.elapsed if current else 0.0,
+            int(player.loop_status),
+            json.dumps([self._persisted_song(song_info) for song_info in queue]),
+            time.time(),
+        )
+
+    async def _checkpoint_sessions(self) -> None:
         try:
-            while self.server_to_voice_client[guild_id] and self.server_to_voice_client[guild_id].is_playing():
-                await self._update_timestamp(guild_id)
-                await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            self.bot.logger.error(f"Failed to track the timestamp: {e}")
+            # positions move without any event, save them now and then in case the process dies
+            for guild_id, player in self.players.items():
+                if player.current_song_info is not None and player.clock.running:
+                    self.sessions.mark(guild_id)
         finally:
-            self.server_to_timestamp_task[guild_id] = None
+            self.timers.schedule(
+                ("checkpoint_sessions",),
+                self.bot.config.get("session_checkpoint_seconds", 30),
+                self._checkpoint_sessions,
+            )
+
+    async def _restore_sessions(self) -> None:
+        """
+        Rejoins the voice channels saved before the last shutdown and resumes their songs and queues.
+        """
+        await self.bot.wait_until_ready()
+        restored = 0
+        for guild_id, voice_channel_id, text_channel_id, current, position, loop_status, queue, _ in await self.sessions.load():
+            guild_id = int(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                if self.bot.ipc is None:
+                    self.sessions.mark(guild_id)  # the bot left the guild, drop the session
+                continue  # otherwise it may belong to another cluster
+            if guild_id in self.players and self.players[guild_id].voice_client is not None:
+                continue  # used since the start
+            try:
+                await self._restore_session(
+                    guild,
+                    int(voice_channel_id),
+                    int(text_channel_id) if text_channel_id else None,
+                    json.loads(current) if current else None,
+                    position,
+                    bool(loop_status),
+                    json.loads(queue),
+                )
+                restored += 1
+            except Exception as e:
+                self.bot.logger.error(f"Failed to restore the session. (guild id: {guild_id}): {e}")
+                self.sessions.mark(guild_id)
+        if restored:
+            self.bot.logger.info(f"Restored {restored} playback sessions.")
+
+    async def _restore_session(
+        self, guild: discord.Guild, voice_channel_id: int, text_channel_id: Union[int, None],
+        current: Union[dict, None], position: float, loop_status: bool, queue: list,
+    ) -> None:
+        """
+        Restores the session of one guild: the queue as pending songs, and the current song,
+        from the cache when it is still there, at the saved position.
+
+        :param guild: The guild.
+        :param voice_channel_id: The ID of the voice channel to rejoin.
+        :param text_channel_id: The ID of the channel the commands were used in, if known.
+        :param current: The saved current song, if any.
+        :param position: The saved position in the current song, in seconds.
+        :param loop_status: The saved loop status.
+        :param queue: The saved queued songs.
+        """
+        channel = guild.get_channel(voice_channel_id)
+        if channel is None:
+            self.sessions.mark(guild.id)
+            return
+        # announcements go to the saved channel, which has send() just like a command context
+        text_channel = guild.get_channel(text_channel_id) if text_channel_id else None
+        player = self._player(guild.id)
+        player.loop_status = loop_status
+        player.text_channel_id = text_channel_id
+        for saved in queue:
+            await player.queue.put({**saved, 'path': None, 'state': 'pending', 'guild_id': guild.id})
+        self._schedule_prefetch(guild.id)
+
+        song_info = None
+        if current is not None:
+            result = await self._fetch_audio(
+                current['url'], guild.id, current.get('requester'), DownloadScheduler.INTERACTIVE
+            )
+            if result is not None:
+                song_info = {**current, 'guild_id': guild.id, 'id': result[0], 'path': result[1],
+                             'state': 'ready', 'acquired': True}
+                await self._ensure_seek_index(song_info)
+
+        if guild.voice_client is not None and guild.voice_client.is_connected():
+            player.voice_client = guild.voice_client
+        else:
+            player.voice_client = await channel.connect()
+
+        if song_info is None:
+            if player.queue.queue:
+                await self._play_next(guild.id, text_channel)
+            return
+        player.current_song_info = song_info
+        player.if_playnow = True
+        player.voice_client.play(
+            self._create_audio_source(song_info, timestamp=position),
+            after=self._create_after_callback(guild.id, text_channel, song_info)
+        )
+        self._start_clock(guild.id, position)
+        self.bot.logger.info(f"Resumed playback at {self._format_time(position)}. (guild id: {guild.id})")
 
     def _fetch_video_sync(self, url: str) -> Union[tuple[str, str], None]:  # TODO: args += path
         """
@@ -204,124 +991,493 @@ class YouTube(commands.Cog, name="youtube"):
             self.bot.logger.error(f"[YouTube] [info] Failed to download {url}")
             return None
 
-    async def _fetch_video_async(self, url: str) -> Union[tuple[str, str], None]:  # file_id, file_path
+    async def _fetch_video_async(
+        self,
+        url: str,
+        audio_format: str = "opus",
+        on_progress: Union[Callable[[YtDlpProgress], None], None] = None,
+        priority: int = DownloadScheduler.BACKGROUND,
+    ) -> Union[YtDlpResult, None]:
         """
         This command fetches the audio from the linked YouTube video asynchronously.
+        With the opus format, the native opus stream is only remuxed, never transcoded.
 
         :param url: The url to the YouTube video.
+        :param audio_format: "opus" (fails if the video has no opus stream) or "mp3".
+        :param on_progress: Called with every progress update of the download.
+        :param priority: The priority of the job in the yt-dlp worker pool.
         """
         output_template = "%(id)s.%(ext)s"  # original: "%(id)s-%(title)s.%
-        # async process
-        # filename = await self._fetch_file_name(url, output_template)
         self.bot.logger.info(f"[YouTube] [info] Start downloading {url}")
+        match_filter = self._duration_filter()
+
+        if self.ytdlp_pool is not None:
+            options = {
+                "format": "bestaudio[acodec=opus]" if audio_format == "opus" else "bestaudio/best",
+                "outtmpl": output_template,
+                "paths": {"home": self.download_dir},
+                "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": audio_format}],
+                "noplaylist": True,
+                "quiet": True,
+                "noprogress": True,
+            }
+            if match_filter:
+                options["match_filter"] = match_filter
+            result = await self.ytdlp_pool.run(url, options, on_progress=on_progress, priority=priority)
+        else:
+            command = [
+                "yt-dlp",
+                url,
+                "--extract-audio",
+                "--audio-format", audio_format,
+                "--no-playlist",
+                "--output", output_template,
+                "--paths", self.download_dir,
+                *structured_output_args(),
+                # "--download-archive", self.download_archive_path,
+            ]
+            if audio_format == "opus":
+                command += ["--format", "bestaudio[acodec=opus]"]
+            if match_filter:
+                command += ["--match-filter", match_filter]
+            result = await run_cli(command, on_progress=on_progress, logger=self.bot.logger)
+
+        if result is None or result.filepath is None:
+            self.bot.logger.error(f"Failed to download a video: <{url}>")
+            return None
+        video_id = self._extract_video_id(url)
+        if video_id is not None and result.id != video_id:
+            # never cache a file under the ID of another video
+            self.bot.logger.error(f"Downloaded {result.id} instead of {video_id}: <{url}>")
+            if result.id not in self.audio_cache.entries:
+                self.quota.delete(result.filepath)
+            return None
+        self.bot.logger.info(f"[YouTube] [info] Successfully downloaded {url}")
+        return result
 
-        command = [
-            "yt-dlp",
-            url,
-            "--extract-audio",
-            "--audio-format", "mp3",
-            "--output", output_template,
-            "--paths", self.download_dir,
-            "--verbose",
-            # "--write-pages",
-            # "--print-traffic",
-            # "--download-archive", self.download_archive_path,
-        ]
+    def _duration_filter(self) -> Union[str, None]:
+        # songs whose duration was not cached when they were admitted are held to the limit by yt-dlp,
+        # which then skips the download
+        max_track_seconds = self.admission.max_track_seconds
+        return f"duration <=? {int(max_track_seconds)}" if max_track_seconds else None
+
+    async def _resolve_stream_url(self, url: str) -> Union[YtDlpResult, None]:
+        """
+        This method resolves the direct url of the best audio stream without downloading anything.
+
+        :param url: The url to the YouTube video.
+        """
+        if self.ytdlp_pool is not None:
+            result = await self.ytdlp_pool.run(url, {
+                "format": "bestaudio[acodec=opus]/bestaudio/best",
+                "noplaylist": True,
+                "quiet": True,
+            }, download=False, timeout=30, priority=DownloadScheduler.INTERACTIVE)
+        else:
+            command = [
+                "yt-dlp",
+                url,
+                "--format", "bestaudio[acodec=opus]/bestaudio/best",
+                "--no-playlist",
+                *structured_output_args("video"),
+            ]
+            result = await run_cli(command, timeout=30, logger=self.bot.logger)
+
+        if result is None or not result.url:
+            self.bot.logger.error(f"Failed to resolve the stream url: <{url}>")
+            return None
+        if result.duration and self.admission.max_track_seconds and result.duration > self.admission.max_track_seconds:
+            self.bot.logger.info(f"[YouTube] [info] Refusing to stream a song longer than the limit: <{url}>")
+            return None
+        return result
+
+    def _create_audio_source(self, song_info: dict, timestamp: float = 0, record: bool = False) -> discord.AudioSource:
+        """
+        Creates the ffmpeg audio source for a song, preferring the local file over the stream url.
+        ffmpeg always emits opus, so no PCM has to be encoded in Python. Opus input is passed
+        through without decoding at all unless a gain has to be applied.
+        A song whose packets are in the frame cache is played from memory instead, and a song
+        that another guild has just started is joined through the broadcast hub.
+
+        Starting at a timestamp never decodes what comes before it: cached packets are indexed
+        directly, Ogg/Opus files are fed to ffmpeg from the page found in their seek index
+        (see _ensure_seek_index), and anything else is seeked on the input side by ffmpeg.
+
+        :param song_info: The song info dict.
+        :param timestamp: The position to start from, in seconds.
+        :param record: Whether to keep the packets of this pass in the frame cache (for loops).
+        """
+        gain = self._playback_gain(song_info)
+        frame_key = f"{song_info['id']}:{gain:.4f}"  # the gain is baked into the packets
+        frames = self.frame_cache.get(frame_key)
+        if frames is not None:
+            return BufferedOpusSource(frames, start=int(timestamp * 50))  # 20 ms per packet
+
+        # within 0.1 dB of unity, the gain is not worth a decode and re-encode
+        needs_gain = abs(20 * math.log10(gain)) > 0.1
+        before_options = []
+        options = "-vn"
+        ffmpeg_options = {
+            "stderr": subprocess.DEVNULL,
+        }
+        seek_index = None
+        if song_info['path'] is None:
+            # streaming: let ffmpeg reconnect if the connection to the CDN drops
+            source = song_info['stream_url']
+            is_opus = song_info.get('stream_codec') == "opus"
+            before_options.append("-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5")
+        else:
+            source = song_info['path']
+            is_opus = source.endswith(".opus")
+            entry = self.audio_cache.entries.get(song_info['id'])
+            if entry is not None and entry.path == source:
+                seek_index = entry.seek_index
+
+        page_offset = None
+        if timestamp and seek_index is not None:
+            # only the distance from the start of the page is left for ffmpeg to skip
+            page_offset, page_time = seek_index.locate(timestamp)
+            ffmpeg_options["pipe"] = True
+            if timestamp - page_time > 0:
+                options += f" -ss {timestamp - page_time:.3f}"
+        elif timestamp:
+            before_options.append(f"-ss {timestamp:.3f}")
+
+        if needs_gain:
+            options += f" -af volume={gain:.4f}"
+        elif is_opus:
+            ffmpeg_options["codec"] = "opus"  # discord.py passes opus input through with "-c:a copy"
+        ffmpeg_options["options"] = options
+        if before_options:
+            ffmpeg_options["before_options"] = " ".join(before_options)
+        duration = self._song_duration(song_info)
+
+        def open_source() -> discord.AudioSource:
+            if page_offset is not None:
+                audio_source = discord.FFmpegOpusAudio(
+                    OggSlice(source, seek_index.header_size, page_offset), **ffmpeg_options
+                )
+            else:
+                audio_source = discord.FFmpegOpusAudio(source, **ffmpeg_options)
+            # only complete passes over a local file are recorded, a stream may end early
+            if record and not timestamp and song_info['path'] is not None:
+                return RecordingSource(
+                    audio_source,
+                    max_bytes=self.frame_cache.max_bytes // 4,
+                    on_complete=lambda frames: self._store_frames(frame_key, duration, frames),
+                )
+            return audio_source
 
-        # process as a coroutine
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+        # guilds that start the same song at the same position share a single ffmpeg process
+        return self.broadcasts.subscribe((frame_key, timestamp), open_source)
+
+    async def _ensure_seek_index(self, song_info: dict) -> None:
+        """
+        Builds the seek index of a cached Ogg/Opus file the first time it is seeked into.
+
+        :param song_info: The song info dict.
+        """
+        entry = self.audio_cache.entries.get(song_info.get('id'))
+        if entry is None or entry.seek_index is not None or not entry.path.endswith(".opus"):
+            return
+        path = entry.path
+        seek_index = await asyncio.to_thread(OggSeekIndex.build, path)
+        if seek_index is None:
+            self.bot.logger.warning(f"[YouTube] Failed to index {path}")
+            return
+        if entry.path == path:
+            entry.seek_index = seek_index
+
+    def _store_frames(self, frame_key: str, duration: Union[float, None], frames: OpusFrameBuffer) -> None:
+        """
+        Keeps a recorded pass in the frame cache. Called from the voice player thread.
+
+        :param frame_key: The frame cache key of the song.
+        :param duration: The duration of the song, if known.
+        :param frames: The recorded opus packets.
+        """
+        # ffmpeg exiting early also ends the source, do not loop a truncated recording
+        if duration and len(frames) * 0.02 < duration - 2:
+            return
+        self.frame_cache.put(frame_key, frames)
+
+    async def _fetch_audio(
+        self, url: str, guild_id: int, user_id: int, priority: int = DownloadScheduler.BACKGROUND
+    ) -> Union[tuple[str, str], None]:  # file_id, file_path
+        """
+        This method returns the audio for the linked YouTube video, from the cache if possible.
+        The caller owns a cache reference to the returned file and must release it with _release_song.
+
+        :param url: The url to the YouTube video.
+        :param guild_id: The ID of the guild the audio is for.
+        :param user_id: The ID of the member who requested the audio.
+        :param priority: The download scheduler priority.
+        """
+        video_id = self._extract_video_id(url)
+        if video_id is not None:
+            file_path = await self.audio_cache.lookup(video_id)
+            if file_path is not None:
+                self.bot.logger.info(f"[YouTube] [info] Cache hit for {video_id}")
+                self.cache_lookups.inc(result="hit")
+                return video_id, file_path
+        self.cache_lookups.inc(result="miss")
+
+        # concurrent requests for the same video share a single download
+        key = video_id or url
+        if key not in self.audio_flights:
+            self.audio_priorities[key] = priority
+        elif priority < self.audio_priorities.get(key, priority):
+            # e.g. playnow joining a prefetch, which must not keep waiting at background priority
+            self.audio_priorities[key] = priority
+            self.download_scheduler.promote(("audio", key), priority)
+        result = await self.audio_flights.do(
+            key, lambda: self._download_audio(url, guild_id, user_id, priority, key)
         )
+        if result is None:
+            return None
+        file_id, file_path = result.id, result.filepath
+        # the first waiter registers the file, the others take their own reference to it
+        if await self.audio_cache.lookup(file_id) is None:
+            await self.audio_cache.store(file_id, file_path)
+            self._spawn(self._analyze_loudness(file_id))
+        return file_id, file_path
+
+    async def _analyze_loudness(self, video_id: str) -> None:
+        """
+        Measures the loudness of a cached file once and stores it with its cache entry,
+        so that playback only has to apply a precomputed static gain.
+
+        :param video_id: The ID of the cached YouTube video.
+        """
+        async with self.loudness_semaphore:
+            entry = self.audio_cache.entries.get(video_id)
+            if entry is None or entry.loudness is not None:
+                return
+            measurement = await analyze_loudness(entry.path)
+        if measurement is None:
+            self.bot.logger.warning(f"[YouTube] Failed to measure the loudness of {video_id}")
+            return
+        await self.audio_cache.set_loudness(video_id, *measurement)
+        self.bot.logger.info(f"[YouTube] Loudness of {video_id}: {measurement[0]:.1f} LUFS, peak {measurement[1]:.1f} dBTP")
+
+    def _playback_gain(self, song_info: dict) -> float:
+        """
+        Returns the linear gain for a song: the configured volume, plus the loudness
+        normalization gain once the cached file has been analyzed.
+
+        :param song_info: The song info dict.
+        """
+        volume = self.bot.config.get("volume", 0.1)
+        entry = self.audio_cache.entries.get(song_info.get('id'))
+        if entry is None or entry.loudness is None:
+            return volume
+        target = self.bot.config.get("loudness_target", -14.0)
+        return volume * normalization_gain(entry.loudness, entry.true_peak, target)
+
+    async def _download_audio(
+        self, url: str, guild_id: int, user_id: int, priority: int, key: str
+    ) -> Union[YtDlpResult, None]:
+        # self.audio_priorities[key] was set by _fetch_audio, and is raised there if a more urgent caller joins
         try:
-            # wait for the subprocess to finish
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=600)
-            stdout, stderr = stdout.decode().strip(), stderr.decode().strip()
-            stdout = stdout.replace("\r", "\n").strip()
-
-            if process.returncode == 0:
-                self.bot.logger.info(f"[YouTube] [info] Successfully downloaded {url}")
-                match_already_recorded = re.search(r'\[download\] ([\w-]+): has already been recorded in the archive', stdout)
-                if match_already_recorded:
-                    self.bot.logger.info("[YouTube] audio already downloaded in the archive.")
-                    file_id = match_already_recorded.group(1)
-                    file_path = os.path.join(self.download_dir, file_id + ".mp3")
-                else:
-                    for line in stdout.split("\n"):
-                        if len(line) == 0:
-                            continue
-                        self.bot.logger.info(f"[YouTube] {line}")
-                        match_file_path = re.search(r'\[ExtractAudio\] Destination: (.+)', line)
-
-                        if match_file_path:
-                            file_path = match_file_path.group(1)
-                            file_id = file_path.split("/")[-1].split(".")[0]
-                            # print("file_id:", file_id)
-                            # print("file_path:", file_path)
-                return file_id, file_path
-            else:
-                self.bot.logger.error(f"Failed to download a video: <{url}>")
-                print("STDOUT:")
-                print(stdout)
+            metadata = self.metadata.get(self._extract_video_id(url))
+            duration = metadata.duration if metadata is not None and metadata.duration else 600
+            estimate = int(duration * AUDIO_BYTES_PER_SECOND)
+            if not await self._make_room(estimate):
+                self.bot.logger.warning(f"[YouTube] Not enough disk space to download {url}")
                 return None
+            priority = self.audio_priorities.get(key, priority)
+            async with self.download_scheduler.slot(guild_id, user_id, priority, key=("audio", key)):
+                priority = self.audio_priorities.get(key, priority)
+                started = time.monotonic()
+                with self.quota.reserve(estimate):
+                    result = await self._fetch_video_async(url, "opus", priority=priority)
+                    if result is None:
+                        self.bot.logger.info(f"[YouTube] [info] Falling back to mp3 for {url}")
+                        result = await self._fetch_video_async(url, "mp3", priority=priority)
+        finally:
+            self.audio_priorities.pop(key, None)
+        if result is not None:
+            self._observe_download("audio", time.monotonic() - started, result.filepath)
+            self.quota.add(result.filepath)
+            await self._remember_metadata(result)
+        await self._make_room()
+        return result
+
+    def _observe_download(self, kind: str, seconds: float, file_path: str) -> None:
+        self.download_seconds.observe(seconds, kind=kind)
+        try:
+            self.download_bytes.observe(os.path.getsize(file_path), kind=kind)
+        except OSError:
+            pass
 
-        except asyncio.TimeoutError:
-            self.bot.logger.error(f"Failed to download a video: <{url}> (Timeout)")
-            process.kill()
-            return None
+    async def _make_room(self, nbytes: int = 0) -> bool:
+        """
+        Evicts unreferenced cached audio, by the cache policy, once dldata/ is past its high watermark
+        (or the disk is nearly full), then returns whether a download of nbytes fits.
+
+        :param nbytes: The expected size of the next download.
+        """
+        excess = self.quota.excess(nbytes)
+        if excess:
+            freed = await self.audio_cache.shrink(excess)
+            self.bot.logger.info(
+                f"[DiskQuota] Evicted {freed / 2**20:.1f} of {excess / 2**20:.1f} MiB, "
+                f"{self.quota.total_bytes / 2**20:.0f} / {self.quota.max_bytes / 2**20:.0f} MiB used."
+            )
+        return self.quota.can_fit(nbytes)
+
+    async def _remember_metadata(self, result: YtDlpResult) -> None:
+        await self.metadata.put(result.id, result.title, result.duration, result.codec)
 
-    # Currently not used
-    async def _async_fetch_playlist(self, url: str) -> str:
+    def _describe_song(self, song_info: dict) -> str:
         """
-        This command fetches the audio from the linked YouTube playlist asynchronously.
+        Returns a markdown link with the title and duration of a song when its metadata is known,
+        or the bare url otherwise.
+
+        :param song_info: The song info dict.
+        """
+        metadata = self.metadata.get(song_info.get('id'))
+        if metadata is None or not metadata.title:
+            return f"<{song_info['url']}>"
+        description = f"[{discord.utils.escape_markdown(metadata.title)}]({song_info['url']})"
+        if metadata.duration:
+            description += f" ({self._format_time(metadata.duration)})"
+        return description
+
+    def _song_duration(self, song_info: dict) -> Union[float, None]:
+        metadata = self.metadata.get(song_info.get('id'))
+        return metadata.duration if metadata is not None else None
+
+    async def _fetch_playlist_page(self, url: str, start: int, count: int) -> Union[tuple, None]:
+        """
+        This method lists one page of a playlist without downloading or resolving any of its videos.
 
         :param url: The url to the YouTube playlist.
+        :param start: The 1-based index of the first entry of the page.
+        :param count: The number of entries in the page.
         """
-        # output_template = "%(id)s.%(ext)s"  # original: "%(id)s-%(title)s.%
-        # async process
-        # filename = await self._fetch_file_name(url, output_template)
-        self.bot.logger.info(f"[YouTube] [info] Start downloading {url}")
+        items = f"{start}-{start + count - 1}"
+        if self.ytdlp_pool is not None:
+            result = await self.ytdlp_pool.run(url, {
+                "extract_flat": "in_playlist",
+                "playlist_items": items,
+                "quiet": True,
+            }, download=False, timeout=60, priority=DownloadScheduler.INTERACTIVE)
+            return result.entries if result is not None else None
 
         command = [
             "yt-dlp",
             url,
-            "--yes-playlist",
-            "--extract-audio",
-            "--audio-format", "mp3",
-            "--output", os.path.join(self.download_dir, "%(playlist_index)s-%(title)s.%(ext)s"),
-            "--ignore-errors"
+            "--flat-playlist",
+            "--playlist-items", items,
+            *structured_output_args("video"),
         ]
+        return await run_cli_entries(command, timeout=60, logger=self.bot.logger)
 
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        # output_template = "%(id)s.%(ext)s"
-        if process.returncode == 0:
-            # Combine audio files into one
-            combined_file_path = os.path.join(self.download_dir, "combined.mp3")
-            files = sorted([os.path.join(self.download_dir, f) for f in os.listdir(self.download_dir) if f.endswith('.mp3')])
-            ffmpeg_concat_cmd = ["ffmpeg", "-y", "-safe", "0", "-f", "concat", "-i"]
-            with open(os.path.join(self.download_dir, "filelist.txt"), "w") as filelist:
-                filelist.writelines(f"file '{file}'\n" for file in files)
-
-            ffmpeg_concat_cmd.append(os.path.join(self.download_dir, "filelist.txt"))
-            ffmpeg_concat_cmd.extend(["-c", "copy", combined_file_path])
-
-            concat_process = await asyncio.create_subprocess_exec(
-                *ffmpeg_concat_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            await concat_process.communicate()
-            file_id = combined_file_path.split("/")[-1].split(".")[0]
-            self.bot.logger.info(f"combined_file_path = {combined_file_path}")
-            return file_id, combined_file_path
-        else:
-            return ""
+    async def _search(self, query: str) -> Union[tuple[str, ...], None]:
+        """
+        Returns the IDs of the videos found for a query, from the search cache if possible.
+        Their titles and durations are in the metadata store afterwards.
+
+        :param query: The search query.
+        """
+        video_ids = self.search_cache.get(query)
+        if video_ids is not None:
+            return video_ids
+        return await self.search_flights.do(SearchCache.normalize(query), lambda: self._run_search(query))
+
+    async def _run_search(self, query: str) -> Union[tuple[str, ...], None]:
+        target = f"ytsearch{self.bot.config.get('search_results', 10)}:{query}"
+        async with self.search_semaphore:
+            if self.ytdlp_pool is not None:
+                result = await self.ytdlp_pool.run(target, {
+                    "extract_flat": "in_playlist",
+                    "quiet": True,
+                }, download=False, timeout=30, priority=DownloadScheduler.INTERACTIVE)
+                entries = result.entries if result is not None else None
+            else:
+                command = [
+                    "yt-dlp",
+                    target,
+                    "--flat-playlist",
+                    *structured_output_args("video"),
+                ]
+                entries = await run_cli_entries(command, timeout=30, logger=self.bot.logger)
+        if entries is None:
+            return None
+        await self.metadata.put_many([(entry.id, entry.title, entry.duration, None) for entry in entries])
+        video_ids = tuple(entry.id for entry in entries)
+        self.search_cache.put(query, video_ids)
+        return video_ids
+
+    async def _expand_playlist(self, context: Context, url: str) -> None:
+        """
+        Streams the entries of a playlist into the queue, page by page, as pending placeholders.
+        Nothing is downloaded here: the prefetcher fetches each song when it gets near the head of the queue.
+
+        :param context: The application command context.
+        :param url: The url to the YouTube playlist.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        try:
+            page_size = self.bot.config.get("playlist_page_size", 50)
+            start, added, refused = 1, 0, {}
+            queued_seconds = self._queued_seconds(player) if self.admission.max_queued_seconds else 0.0
+            queue_full = False
+            while True:
+                entries = await self._fetch_playlist_page(url, start, page_size)
+                if entries is None:
+                    break
+                await self.metadata.put_many([(entry.id, entry.title, entry.duration, None) for entry in entries])
+                admitted = []
+                for entry in entries:
+                    reason = self.admission.check_song(entry.duration, len(player.queue) + len(admitted), queued_seconds)
+                    if reason is None:
+                        admitted.append(entry)
+                        queued_seconds += entry.duration or 0.0
+                    elif self.admission.max_queue_length and len(player.queue) + len(admitted) >= self.admission.max_queue_length:
+                        queue_full = True
+                        refused[reason] = refused.get(reason, 0) + 1
+                        break
+                    else:
+                        refused[reason] = refused.get(reason, 0) + 1
+                for entry in admitted:
+                    await player.queue.put({
+                        'url': entry.url or f"https://www.youtube.com/watch?v={entry.id}",
+                        'id': entry.id,
+                        'path': None,
+                        'state': 'pending',
+                        'guild_id': guild_id,
+                        'requester': context.author.id,
+                    })
+                added += len(admitted)
+                self._schedule_prefetch(guild_id)
+                self.sessions.mark(guild_id)
+
+                # start playing as soon as the first page is in
+                # the voice client is gone if the bot left the channel in the meantime
+                voice_client = player.voice_client
+                if start == 1 and admitted and voice_client is not None and not voice_client.is_playing():
+                    self._spawn(self._play_next(guild_id, context))
+                if len(entries) < page_size or queue_full:
+                    break
+                start += page_size
+
+            if added == 0 and not refused:
+                embed = discord.Embed(description="Failed to fetch the playlist.", color=0xE02B2B)
+            else:
+                lines = [f"Added {added} songs from the playlist."]
+                lines += [f"{count} {'song' if count == 1 else 'songs'} refused: {reason}." for reason, count in refused.items()]
+                if queue_full:
+                    lines.append("The rest of the playlist was not listed.")
+                self.admission.rejected += sum(refused.values())
+                embed = discord.Embed(description="\n".join(lines), color=0xE02B2B)
+            await context.send(embed=embed)
+        finally:
+            # a newer playlist command may have replaced this task already
+            if player.playlist_task is asyncio.current_task():
+                player.playlist_task = None
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after) -> None:
@@ -335,88 +1491,118 @@ class YouTube(commands.Cog, name="youtube"):
         """
         if member.id == self.bot.user.id:
             guild_id = member.guild.id
+            player = self.players.get(guild_id)
+            if player is None:
+                return
             if before.channel is not None and after.channel is None:
-                if self.server_to_expected_disconnection[guild_id]:
+                if player.expected_disconnection:
                     self.bot.logger.info(f"Detected normal disconnection. (guild id: {guild_id})")
-                    self.server_to_expected_disconnection[guild_id] = False
+                    player.expected_disconnection = False
                 else:
                     self.bot.logger.info(f"Detected unexpected disconnection. (guild id: {guild_id})")
+                    player.clock.pause()
                     # reconnect to the voice channel
                     try:
-                        self.server_to_voice_client[guild_id] = await before.channel.connect()
+                        player.voice_client = await before.channel.connect()
                         self.bot.logger.info("Reconnected to the voice channel.")
                     except Exception as e:
                         self.bot.logger.error(f"Failed to reconnect to the voice channel: {str(e)}")
 
-                    if self.server_to_if_playnow[guild_id] is False:
+                    if player.if_playnow is False:
                         return
 
-                    if self.server_to_current_song_info[guild_id]:
+                    if player.current_song_info:
                         await self._resume_playback(guild_id)
 
     async def _resume_playback(self, guild_id: int) -> None:
-        current_song = self.server_to_current_song_info[guild_id]
+        player = self._player(guild_id)
+        current_song = player.current_song_info
         if current_song:
-            file_path = current_song['path']
-            ffmpeg_options = {
-                "options": f"-af 'volume=0.1' -vn -ac 2 -ss {self.server_to_timestamps[guild_id]}",
-                "stderr": subprocess.DEVNULL,
-            }
-            self.server_to_voice_client[guild_id].play(
-                discord.FFmpegPCMAudio(file_path, **ffmpeg_options),
-                after=self._create_after_callback(guild_id, None)
+            await self._ensure_seek_index(current_song)
+            position = player.clock.elapsed
+            player.voice_client.play(
+                self._create_audio_source(current_song, timestamp=position),
+                after=self._create_after_callback(guild_id, None, current_song)
             )
-            if self.server_to_current_loop_status[guild_id]:
+            self._start_clock(guild_id, position)
+            if player.loop_status:
                 self.bot.logger.info(f"Resuming playback with loop status: on (guild id: {guild_id})")
             else:
                 self.bot.logger.info(f"Resuming playback with loop status: off (guild id: {guild_id})")
 
     async def _play_next(self, guild_id: int, context: Context) -> None:
-        # ensure the audio is not playing
-        if self.server_to_voice_client[guild_id].is_playing():
+        # ensure the audio is not playing and that no other call is already starting the next song
+        player = self._player(guild_id)
+        lock = player.play_next_lock
+        if player.voice_client is None or player.voice_client.is_playing() or lock.locked():
             self.bot.logger.info(f"function _play_next is called while playing. (guild id: {guild_id}) ")
             return
 
-        # remove the current song
-        current_song = self.server_to_current_song_info[guild_id]
-        if current_song:
-            try:
-                os.remove(current_song['path'])
-            except OSError:
-                pass
+        async with lock:
+            # release the current song
+            self._release_song(player.current_song_info)
+            player.current_song_info = None
 
-        if not self.server_to_queue[guild_id].queue:
-            embed = discord.Embed(description="The queue is now empty.", color=0xE02B2B)
-            await context.send(embed=embed)
-            self.server_to_if_playnow[guild_id] = False
-            self.server_to_current_song_info[guild_id] = None
-            self.server_to_timestamps[guild_id] = 0
-            return
+            while True:
+                if not player.queue.queue:
+                    if context:
+                        embed = discord.Embed(description="The queue is now empty.", color=0xE02B2B)
+                        await context.send(embed=embed)
+                    player.if_playnow = False
+                    self._stop_clock(guild_id)
+                    return
+
+                next_song_info = await player.queue.get()
+                self._schedule_prefetch(guild_id)
+                if next_song_info['state'] == 'pending':
+                    # the prefetcher has not finished this one yet
+                    player.pending_song = next_song_info
+                    await self._ensure_resolving(next_song_info)
+                    if player.pending_song is not next_song_info:
+                        return  # stopped or left while waiting, the song was released with the queue
+                    player.pending_song = None
+                if next_song_info['state'] == 'ready':
+                    break
+                if context:
+                    embed = discord.Embed(
+                        description=f"Failed to fetch the audio: <{next_song_info['url']}>", color=0xE02B2B
+                    )
+                    await context.send(embed=embed)
 
-        if self.server_to_timestamp_task[guild_id]:
-            self.server_to_timestamp_task[guild_id].cancel()
+            # playnow may have started something while we were waiting for the download,
+            # or the voice connection may have dropped
+            if player.voice_client is None or player.voice_client.is_playing():
+                await player.queue.put_front(next_song_info)
+                return
 
-        self.server_to_timestamp_task[guild_id] = await self._start_timestamp_tracking(guild_id)
+            player.current_song_info = next_song_info
+            player.voice_client.play(
+                self._create_audio_source(next_song_info, record=player.loop_status),
+                after=self._create_after_callback(guild_id, context, next_song_info)
+            )
+            self._start_clock(guild_id)
 
-        next_song_info = await self.server_to_queue[guild_id].get()
-        self.server_to_current_song_info[guild_id] = next_song_info
-        self.server_to_current_song_info[guild_id]['start_time'] = discord.utils.utcnow()
+        if context:
+            embed = discord.Embed(
+                description=f"Playing Now: {self._describe_song(next_song_info)}\nLoop status: {player.loop_status}",
+                color=0xE02B2B
+            )
+            await context.send(embed=embed)
 
-        ffmpeg_options = {
-            "options": "-af 'volume=0.1' -vn -ac 2",
-            "stderr": subprocess.DEVNULL,
-        }
-        self.server_to_voice_client[guild_id].play(
-            discord.FFmpegPCMAudio(next_song_info['path'], **ffmpeg_options),
-            after=self._create_after_callback(guild_id, context)
-        )
-        await self._start_timestamp_tracking(guild_id)
+    def _remaining_time(self, guild_id: int) -> Union[float, None]:
+        """
+        Returns the number of seconds until the current song ends, or None if its duration is unknown.
 
-        embed = discord.Embed(
-            description=f"Playing Now: <{next_song_info['url']}>\nLoop status: {self.server_to_current_loop_status[guild_id]}",
-            color=0xE02B2B
-        )
-        await context.send(embed=embed)
+        :param guild_id: The ID of the guild.
+        """
+        player = self.players.get(guild_id)
+        if player is None or player.current_song_info is None:
+            return 0
+        song_info = player.current_song_info
+        duration = self._song_duration(song_info)
+        if not duration:
+            return None
+        return max(duration - player.clock.elapsed, 0)
 
     def _format_time(self, seconds: int) -> str:
         minutes, seconds = divmod(int(seconds), 60)
@@ -447,20 +1633,23 @@ class YouTube(commands.Cog, name="youtube"):
 
         :param context: The application command context.
         """
+        started = time.monotonic()
         guild_id = context.guild.id
-        self.bot.logger.info(f"self.server_to_if_playnow[guild_id] is {self.server_to_if_playnow[guild_id]}.")
+        player = self._player(guild_id)
+        self.bot.logger.info(f"if_playnow is {player.if_playnow}. (guild id: {guild_id})")
+
+        url = url.strip()
+        if not await self._admit(context, [self._new_song(url, guild_id, context.author.id)], queued=False):
+            return
 
         # join the voice channel if not joined
-        if self.server_to_voice_client[guild_id] is None or not self.server_to_voice_client[guild_id].is_connected():
+        if player.voice_client is None or not player.voice_client.is_connected():
             await self.ytjoin(context)
 
         # fetch the audio
-        url = url.strip()
         await context.reply(f"Playing Now: {url} Start downloading...")
-        result = await self._fetch_video_async(url)
-        if result is not None:
-            file_id, file_path = result
-        else:
+        song_info = await self._open_song(url, guild_id, context.author.id)
+        if song_info is None:
             embed = discord.Embed(
                 description="Failed to fetch the audio.", color=0xE02B2B
             )
@@ -468,95 +1657,504 @@ class YouTube(commands.Cog, name="youtube"):
             return
 
         # play
-        ffmpeg_options = {
-            "options": "-af 'volume=0.1' -vn -ac 2",
-            "stderr": subprocess.DEVNULL,
-        }
-        self.server_to_current_song_info[guild_id] = {
-            'url': url,
-            'id': file_id,
-            'path': file_path,
-            'start_time': discord.utils.utcnow()
-        }
+        self._release_song(player.current_song_info)
+        player.current_song_info = song_info
 
         # stop if playing
-        if self.server_to_voice_client[guild_id].is_playing():
+        if player.voice_client.is_playing():
             self.bot.logger.info(f"Stopping currently playing audio. (guild id: {guild_id}) ")
-            self.server_to_voice_client[guild_id].stop()
+            player.voice_client.stop()
 
         # play the audio
-        self.server_to_if_playnow[context.guild.id] = True
-        self.server_to_voice_client[guild_id].play(
-            discord.FFmpegPCMAudio(file_path, **ffmpeg_options),
-            after=self._create_after_callback(guild_id, context)
+        player.if_playnow = True
+        player.voice_client.play(
+            self._create_audio_source(song_info, record=player.loop_status),
+            after=self._create_after_callback(guild_id, context, song_info)
         )
-        self.bot.loop.create_task(self._start_timestamp_tracking(guild_id))
+        self._start_clock(guild_id)
+        self.first_audio_seconds.observe(time.monotonic() - started, command="playnow")
 
         embed = discord.Embed(
-            description=f"Playing Now: <{url}>\nLoop status: {self.server_to_current_loop_status[guild_id]}", color=0xE02B2B
+            description=f"Playing Now: {self._describe_song(song_info)}\nLoop status: {player.loop_status}",
+            color=0xE02B2B
         )
 
         await context.send(embed=embed)
 
+    def _queued_seconds(self, player: GuildPlayer) -> float:
+        # only the durations in the metadata cache count, unknown ones are held to the limit by yt-dlp
+        total = self._remaining_time(player.guild_id) or 0.0
+        for song_info in player.queue.queue:
+            total += self._song_duration(song_info) or 0.0
+        return total
+
+    async def _admit(self, context: Context, songs: list[dict], queued: bool = True) -> list[dict]:
+        """
+        Returns the songs that may be queued, in order, and tells the member why the others may not.
+        Runs before anything is downloaded, from the metadata cache and the rate limit buckets only.
+
+        :param context: The application command context.
+        :param songs: The song info dicts to queue.
+        :param queued: Whether the songs go into the queue (and count against its limits) or play right away.
+        """
+        player = self._player(context.guild.id)
+        queue_length = len(player.queue) if queued else 0
+        queued_seconds = self._queued_seconds(player) if queued and self.admission.max_queued_seconds else 0.0
+        admitted, refused = [], {}
+        for song_info in songs:
+            duration = self._song_duration(song_info)
+            reason = self.admission.check_song(duration, queue_length, queued_seconds if queued else 0.0)
+            if reason is not None:
+                refused[reason] = refused.get(reason, 0) + 1
+                continue
+            admitted.append(song_info)
+            queue_length += 1 if queued else 0
+            queued_seconds += duration or 0.0
+
+        granted, retry_after = self.admission.acquire(context.guild.id, context.author.id, len(admitted))
+        if granted < len(admitted):
+            refused[f"songs are being added too fast, try again in {math.ceil(retry_after)} seconds"] = len(admitted) - granted
+            admitted = admitted[:granted]
+
+        if refused:
+            self.admission.rejected += sum(refused.values())
+            lines = [f"{count} {'song' if count == 1 else 'songs'} refused: {reason}." for reason, count in refused.items()]
+            embed = discord.Embed(description="\n".join(lines), color=0xE02B2B)
+            await context.reply(embed=embed)
+        return admitted
+
+    @staticmethod
+    def _parse_urls(text: str) -> list[str]:
+        """
+        Splits a pasted list of urls, separated by spaces, commas or new lines, and possibly wrapped in <>.
+
+        :param text: The text to parse.
+        """
+        urls = [token.strip("<>") for token in URL_SEPARATOR_PATTERN.split(text)]
+        urls = [url for url in urls if url.startswith(("http://", "https://"))]
+        return urls or ([text.strip()] if text.strip() else [])
+
+    def _new_song(self, url: str, guild_id: int, user_id: int) -> dict:
+        return {
+            'url': url,
+            'id': self._extract_video_id(url),
+            'path': None,
+            'state': 'pending',
+            'guild_id': guild_id,
+            'requester': user_id,
+        }
+
+    async def _enqueue_urls(self, context: Context, urls: list[str]) -> None:
+        """
+        Queues several songs at once, in the given order, and downloads them all concurrently
+        (as far as the download scheduler allows) instead of waiting for the prefetcher to reach them.
+        Playback starts as soon as the first one is ready.
+
+        :param context: The application command context.
+        :param urls: The urls to the YouTube videos.
+        """
+        started = time.monotonic()
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        max_urls = self.bot.config.get("batch_add_max_urls", 50)
+        ignored = len(urls) - max_urls
+        urls = urls[:max_urls]
+
+        songs = await self._admit(context, [self._new_song(url, guild_id, context.author.id) for url in urls])
+        if not songs:
+            return
+        for song_info in songs:
+            await player.queue.put(song_info)
+        # someone is waiting for the first song if nothing is queued before it
+        first_priority = DownloadScheduler.INTERACTIVE if len(player.queue) == len(songs) else DownloadScheduler.BACKGROUND
+        self._ensure_resolving(songs[0], first_priority)
+        for song_info in songs[1:]:
+            self._ensure_resolving(song_info)
+        self.sessions.mark(guild_id)
+
+        if len(songs) == 1:
+            await context.reply(f"Added to the queue: {self._describe_song(songs[0])}")
+        else:
+            message = f"Added {len(songs)} songs to the queue."
+            if ignored > 0:
+                message += f" The last {ignored} urls were ignored, at most {max_urls} can be added at once."
+            await context.reply(message)
+
+        if not player.voice_client or not player.voice_client.is_connected():
+            await self.ytjoin(context)
+            if player.voice_client is None:
+                return
+
+        if not player.voice_client.is_playing():
+            await self._play_next(guild_id, context)
+            if player.current_song_info is songs[0] and player.clock.started_at is not None:
+                # the clock started with playback, before the song was announced
+                self.first_audio_seconds.observe(player.clock.started_at - started, command="add")
+
     @commands.hybrid_command(
         name="add",
-        description="Add the audio from the linked YouTube video to the queue.",
+        description="Add the audio from the linked YouTube videos to the queue.",
     )
-    async def add(self, context: Context, url: str) -> None:
+    async def add(self, context: Context, *, urls: str) -> None:
         """
-        This command adds the audio from the linked YouTube video to the queue.
+        This command adds the audio from one or more linked YouTube videos to the queue, in the given order.
 
         :param context: The application command context.
+        :param urls: The urls to the YouTube videos, separated by spaces, commas or new lines.
         """
-        guild_id = context.guild.id
-        url = url.strip()
-        await context.reply(f"Adding to the queue: {url} Start downloading...")
+        urls = self._parse_urls(urls)
+        if not urls:
+            await context.reply("No url was given.")
+            return
+        await self._enqueue_urls(context, urls)
 
-        result = await self._fetch_video_async(url)
+    @commands.hybrid_command(
+        name="addbulk",
+        description="Add a pasted or attached list of YouTube videos to the queue.",
+    )
+    async def addbulk(
+        self, context: Context, file: Union[discord.Attachment, None] = None, *, urls: str = ""
+    ) -> None:
+        """
+        This command adds a list of YouTube videos to the queue, pasted or attached as a text file
+        with one url per line.
 
-        if result is not None:
-            file_id, file_path = result
-            song_info = {
-                'url': url,
-                'id': file_id,
-                'path': file_path,
-            }
-            await self.server_to_queue[guild_id].put(song_info)
-            await context.send(f"Added to the queue: <{url}>")
+        :param context: The application command context.
+        :param file: A text file with the urls.
+        :param urls: The urls to the YouTube videos, separated by spaces, commas or new lines.
+        """
+        text = urls
+        if file is not None:
+            if file.size > 1024 * 1024:
+                await context.reply("The file is too large.")
+                return
+            text += "\n" + (await file.read()).decode("utf-8", errors="ignore")
+        urls = [url for url in self._parse_urls(text) if url.startswith(("http://", "https://"))]
+        if not urls:
+            await context.reply("No url was found.")
+            return
+        await self._enqueue_urls(context, urls)
 
-            if not self.server_to_voice_client[guild_id] or not self.server_to_voice_client[guild_id].is_connected():
-                await self.ytjoin(context)
+    @commands.hybrid_command(
+        name="search",
+        description="Search YouTube and add one of the results to the queue.",
+    )
+    @app_commands.describe(query="Keywords to search for, or pick one of the suggestions")
+    async def search(self, context: Context, *, query: str) -> None:
+        """
+        This command searches YouTube and lets the member pick a result to add to the queue.
+        A suggestion picked from the autocomplete is a url and is added right away.
 
-            if not self.server_to_voice_client[guild_id].is_playing():
-                await self._play_next(guild_id, context)
-        else:
+        :param context: The application command context.
+        :param query: The keywords to search for.
+        """
+        query = query.strip()
+        if query.startswith(("http://", "https://")):
+            await self._enqueue_urls(context, [query])
+            return
+        # a search that is not cached may take longer than the 3 seconds of an interaction
+        await context.defer()
+        video_ids = await self._search(query)
+        if not video_ids:
+            embed = discord.Embed(description=f"No results for {discord.utils.escape_markdown(query)}.", color=0xE02B2B)
+            await context.send(embed=embed)
+            return
+
+        lines, options = [], []
+        for i, video_id in enumerate(video_ids[:25], start=1):
+            song_info = {'id': video_id, 'url': f"https://www.youtube.com/watch?v={video_id}"}
+            lines.append(f"{i}. {self._describe_song(song_info)}")
+            metadata = self.metadata.get(video_id)
+            title = metadata.title if metadata is not None and metadata.title else video_id
+            duration = metadata.duration if metadata is not None else None
+            options.append(discord.SelectOption(
+                label=f"{i}. {title}"[:100],
+                value=video_id,
+                description=self._format_time(duration) if duration else None,
+            ))
+        embed = discord.Embed(
+            title=f"Results for {query}"[:256], description="\n".join(lines)[:4096], color=0xE02B2B
+        )
+
+        async def on_select(video_id: str) -> None:
+            await self._enqueue_urls(context, [f"https://www.youtube.com/watch?v={video_id}"])
+
+        await context.send(embed=embed, view=SearchResultView(options, context.author.id, on_select))
+
+    @search.autocomplete("query")
+    async def search_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """
+        Suggests videos for the text typed so far. Discord drops the answer after 3 seconds, so
+        a query that is not cached is only waited for briefly: it keeps running in the background
+        and fills the cache for the next keystrokes, which meanwhile get the results of cached
+        queries starting with the same text.
+
+        :param interaction: The autocomplete interaction.
+        :param current: The text typed so far.
+        """
+        current = current.strip()
+        if len(current) < 3 or current.startswith(("http://", "https://")):
+            return []
+        video_ids = self.search_cache.get(current)
+        # never queue extractions behind each other on every keystroke
+        if video_ids is None and not self.search_semaphore.locked():
+            task = self._spawn(self._search(current))
+            try:
+                video_ids = await asyncio.wait_for(
+                    asyncio.shield(task), timeout=self.bot.config.get("search_autocomplete_wait_seconds", 2.0)
+                )
+            except asyncio.TimeoutError:
+                video_ids = None
+        if video_ids is None:
+            video_ids = self.search_cache.complete(current, 25)
+
+        choices = []
+        for video_id in video_ids[:25]:
+            metadata = self.metadata.get(video_id)
+            name = metadata.title if metadata is not None and metadata.title else video_id
+            choices.append(app_commands.Choice(name=name[:100], value=f"https://www.youtube.com/watch?v={video_id}"))
+        return choices
+
+    @commands.hybrid_command(
+        name="playlist",
+        description="Add every video of the linked YouTube playlist to the queue.",
+    )
+    async def playlist(self, context: Context, url: str) -> None:
+        """
+        This command adds every video of the linked YouTube playlist to the queue.
+        The playlist is listed page by page and each song is only downloaded shortly before it plays.
+
+        :param context: The application command context.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        url = url.strip()
+
+        # a playlist costs one token, its songs are held to the queue limits as they are listed
+        granted, retry_after = self.admission.acquire(guild_id, context.author.id, 1)
+        if not granted:
             embed = discord.Embed(
-                description="Failed to fetch the audio.", color=0xE02B2B
+                description=f"Songs are being added too fast, try again in {math.ceil(retry_after)} seconds.",
+                color=0xE02B2B,
             )
             await context.reply(embed=embed)
+            return
+
+        if not player.voice_client or not player.voice_client.is_connected():
+            await self.ytjoin(context)
+            if player.voice_client is None:
+                return
+
+        await context.reply(f"Adding the playlist to the queue: <{url}>")
+        player.playlist_task = self._spawn(self._expand_playlist(context, url))
 
     @commands.hybrid_command(
         name="queue",
         description="Show the queue.",
     )
-    async def queue(self, context: Context) -> None:
+    async def queue(self, context: Context, page: int = 1) -> None:
         """
-        This command shows the queue.
+        This command shows a page of the queue.
 
         :param context: The application command context.
+        :param page: The page to show, starting from 1.
         """
         guild_id = context.guild.id
-        queue = self.server_to_queue[guild_id]
-        if queue.queue:
-            queue_list = [f"{i + 1}. {song['url']}" for i, song in enumerate(queue.queue)]
+        player = self._player(guild_id)
+        if not player.queue.queue:
+            await context.send("The queue is empty.")
+            return
+        embed, page = self._render_queue_page(guild_id, page)
+        if len(player.queue) > QUEUE_PAGE_SIZE:
+            await context.send(embed=embed, view=QueuePageView(lambda p: self._render_queue_page(guild_id, p), page))
+        else:
+            await context.send(embed=embed)
+
+    def _render_queue_page(self, guild_id: int, page: int) -> tuple[discord.Embed, int]:
+        """
+        Renders one page of the queue from the cached metadata, without touching the network.
+
+        :param guild_id: The ID of the guild.
+        :param page: The page to render, starting from 1. Out of range pages wrap around.
+        :return: The embed and the page it shows.
+        """
+        queue = self._player(guild_id).queue
+        pages = max(math.ceil(len(queue) / QUEUE_PAGE_SIZE), 1)
+        page = (page - 1) % pages + 1
+        start = (page - 1) * QUEUE_PAGE_SIZE
+
+        # estimate when each song starts from the cached durations, as long as they are all known
+        eta = self._remaining_time(guild_id)
+        for song in itertools.islice(queue.queue, start):
+            if eta is None:
+                break
+            duration = self._song_duration(song)
+            eta = eta + duration if duration else None
+
+        lines, length = [], 0
+        for i, song in enumerate(queue.page(start, QUEUE_PAGE_SIZE), start=start + 1):
+            line = f"{i}. {self._describe_song(song)}"
+            if song['state'] != 'ready':
+                line += f" ({song['state']})"
+            if eta is not None:
+                line += f" - in {self._format_time(eta)}"
+                duration = self._song_duration(song)
+                eta = eta + duration if duration else None
+            length += len(line) + 1
+            if length > 4000:
+                break
+            lines.append(line)
+        embed = discord.Embed(title="Queue", description="\n".join(lines), color=0xE02B2B)
+
+        footer = f"Page {page}/{pages} - {len(queue)} songs"
+        if eta is not None:
+            for song in itertools.islice(queue.queue, start + QUEUE_PAGE_SIZE, None):
+                duration = self._song_duration(song)
+                if not duration:
+                    eta = None
+                    break
+                eta += duration
+        if eta is not None:
+            footer += f" - Total remaining: {self._format_time(eta)}"
+        embed.set_footer(text=footer)
+        return embed, page
+
+    def _queue_index(self, player: GuildPlayer, position: int, insert: bool = False) -> Union[int, None]:
+        # positions are 1-based as shown by the queue command, inserting may also append at the end
+        upper = len(player.queue) + (1 if insert else 0)
+        return position - 1 if 1 <= position <= upper else None
+
+    async def _reply_invalid_position(self, context: Context, player: GuildPlayer) -> None:
+        embed = discord.Embed(
+            description=f"The position must be between 1 and {len(player.queue)}.", color=0xE02B2B
+        )
+        await context.reply(embed=embed)
+
+    @commands.hybrid_command(
+        name="remove",
+        description="Remove a song from the queue.",
+    )
+    async def remove(self, context: Context, position: int) -> None:
+        """
+        This command removes the song at a position of the queue.
+
+        :param context: The application command context.
+        :param position: The position of the song in the queue, starting from 1.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        index = self._queue_index(player, position)
+        if index is None:
+            await self._reply_invalid_position(context, player)
+            return
+        song_info = player.queue.remove_at(index)
+        self._release_song(song_info)
+        self._schedule_prefetch(guild_id)
+        self.sessions.mark(guild_id)
+        await context.reply(f"Removed from the queue: {self._describe_song(song_info)}")
+
+    @commands.hybrid_command(
+        name="move",
+        description="Move a song to another position in the queue.",
+    )
+    async def move(self, context: Context, position: int, new_position: int) -> None:
+        """
+        This command moves a song of the queue to another position.
+
+        :param context: The application command context.
+        :param position: The current position of the song, starting from 1.
+        :param new_position: The position to move the song to, starting from 1.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        index, new_index = self._queue_index(player, position), self._queue_index(player, new_position)
+        if index is None or new_index is None:
+            await self._reply_invalid_position(context, player)
+            return
+        song_info = player.queue.move(index, new_index)
+        self._schedule_prefetch(guild_id)
+        self.sessions.mark(guild_id)
+        await context.reply(f"Moved to position {new_position}: {self._describe_song(song_info)}")
+
+    @commands.hybrid_command(
+        name="insert",
+        description="Insert the audio from the linked YouTube video at a position in the queue.",
+    )
+    async def insert(self, context: Context, position: int, url: str) -> None:
+        """
+        This command inserts the audio from the linked YouTube video at a position in the queue.
+
+        :param context: The application command context.
+        :param position: The position to insert the song at, starting from 1.
+        :param url: The url to the YouTube video.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        index = self._queue_index(player, position, insert=True)
+        if index is None:
             embed = discord.Embed(
-                title="Queue",
-                description="\n".join(queue_list),
-                color=0xE02B2B
+                description=f"The position must be between 1 and {len(player.queue) + 1}.", color=0xE02B2B
             )
-            await context.send(embed=embed)
-        else:
-            await context.send("The queue is empty.")
+            await context.reply(embed=embed)
+            return
+        admitted = await self._admit(context, [self._new_song(url.strip(), guild_id, context.author.id)])
+        if not admitted:
+            return
+        song_info = admitted[0]
+        player.queue.insert(index, song_info)
+        self._schedule_prefetch(guild_id)
+        self.sessions.mark(guild_id)
+        await context.reply(f"Inserted at position {position}: {self._describe_song(song_info)}")
+
+        if not player.voice_client or not player.voice_client.is_connected():
+            await self.ytjoin(context)
+            if player.voice_client is None:
+                return
+
+        if not player.voice_client.is_playing():
+            await self._play_next(guild_id, context)
+
+    @commands.hybrid_command(
+        name="shuffle",
+        description="Shuffle the queue.",
+    )
+    async def shuffle(self, context: Context) -> None:
+        """
+        This command shuffles the queue.
+
+        :param context: The application command context.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        if len(player.queue) < 2:
+            await context.send("There is nothing to shuffle.")
+            return
+        player.queue.shuffle()
+        self._schedule_prefetch(guild_id)
+        self.sessions.mark(guild_id)
+        embed = discord.Embed(description=f"Shuffled {len(player.queue)} songs.", color=0xE02B2B)
+        await context.send(embed=embed)
+
+    @commands.hybrid_command(
+        name="dedupe",
+        description="Remove the duplicate songs from the queue.",
+    )
+    async def dedupe(self, context: Context) -> None:
+        """
+        This command removes every song that is already earlier in the queue.
+
+        :param context: The application command context.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        removed = player.queue.dedupe(lambda song_info: song_info.get('id') or song_info['url'])
+        for song_info in removed:
+            self._release_song(song_info)
+        if removed:
+            self._schedule_prefetch(guild_id)
+            self.sessions.mark(guild_id)
+        embed = discord.Embed(description=f"Removed {len(removed)} duplicate songs.", color=0xE02B2B)
+        await context.send(embed=embed)
 
     @commands.hybrid_command(
         name="skip",
@@ -569,22 +2167,14 @@ class YouTube(commands.Cog, name="youtube"):
         :param context: The application command context.
         """
         guild_id = context.guild.id
-        if self.server_to_voice_client[guild_id].is_playing():
-            self.server_to_voice_client[guild_id].stop()
-
-            if self.server_to_timestamp_task[guild_id]:
-                self.server_to_timestamp_task[guild_id].cancel()
-                self.server_to_timestamp_task[guild_id] = None
-
-            # delete the file
-            current_song = self.server_to_current_song_info[guild_id]
-            if current_song:
-                try:
-                    os.remove(current_song['path'])
-                except OSError:
-                    pass
-            self.server_to_current_song_info[guild_id] = None
-            self.server_to_timestamps[guild_id] = 0
+        player = self._player(guild_id)
+        if player.voice_client.is_playing():
+            player.voice_client.stop()
+
+            # release the file
+            self._release_song(player.current_song_info)
+            player.current_song_info = None
+            self._stop_clock(guild_id)
             embed = discord.Embed(description="Skipped the current audio.", color=0xE02B2B)
 
             await context.send(embed=embed)
@@ -603,14 +2193,23 @@ class YouTube(commands.Cog, name="youtube"):
         :param context: The application command context.
         """
         guild_id = context.guild.id
-        self.server_to_current_loop_status[guild_id] = False
-        self.server_to_if_playnow[guild_id] = False
-
-        if self.server_to_voice_client[guild_id].is_playing():
-            self.server_to_voice_client[guild_id].stop()
-            self.server_to_current_song_info[guild_id] = None
-            self.server_to_timestamps[guild_id] = 0
-        self.server_to_queue[guild_id] = AsyncioDequeQueue()
+        player = self._player(guild_id)
+        player.loop_status = False
+        player.if_playnow = False
+        if player.playlist_task:
+            player.playlist_task.cancel()
+            player.playlist_task = None
+
+        if player.voice_client is not None and player.voice_client.is_playing():
+            player.voice_client.stop()
+            self._release_song(player.current_song_info)
+            player.current_song_info = None
+            self._stop_clock(guild_id)
+        self._release_pending_song(player)
+        for song_info in player.queue.queue:
+            self._release_song(song_info)
+        player.queue = AsyncioDequeQueue()
+        self.sessions.mark(guild_id)
         embed = discord.Embed(
             description="Playback stopped and queue cleared.", color=0xE02B2B
         )
@@ -628,6 +2227,7 @@ class YouTube(commands.Cog, name="youtube"):
         :param context: The application command context.
         """
         user = context.author
+        player = self._player(context.guild.id)
         if_send_embed = True
 
         if user.voice is None:
@@ -636,14 +2236,14 @@ class YouTube(commands.Cog, name="youtube"):
             )
             await context.reply(embed=embed)
             return
-        if self.server_to_voice_client[context.guild.id] is not None:
-            if self.server_to_voice_client[context.guild.id].is_connected() is True:
-                self.server_to_expected_disconnection[context.guild.id] = True
-                await self.server_to_voice_client[context.guild.id].disconnect()
-                self.server_to_voice_client[context.guild.id] = None
+        if player.voice_client is not None:
+            if player.voice_client.is_connected() is True:
+                player.expected_disconnection = True
+                await player.voice_client.disconnect()
+                player.voice_client = None
                 if_send_embed = False
 
-        self.server_to_voice_client[context.guild.id] = await user.voice.channel.connect()
+        player.voice_client = await user.voice.channel.connect()
         latency = self.bot.latency * 1000
         if if_send_embed:
             embed = discord.Embed(
@@ -668,8 +2268,9 @@ class YouTube(commands.Cog, name="youtube"):
 
         :param context: The application command context.
         """
-        voice_client = self.server_to_voice_client[context.guild.id]
-        self.server_to_if_playnow[context.guild.id] = False
+        player = self._player(context.guild.id)
+        voice_client = player.voice_client
+        player.if_playnow = False
         if voice_client is None:
             embed = discord.Embed(
                 description="Youtube Playback Bot is not connected to a voice channel.", color=0xE02B2B
@@ -681,9 +2282,14 @@ class YouTube(commands.Cog, name="youtube"):
                 description=f"Leaving {voice_client.channel.mention} 👋", color=0xE02B2B
             )
             await context.send(embed=embed)
-            self.server_to_expected_disconnection[context.guild.id] = True
+            player.expected_disconnection = True
             await voice_client.disconnect()
-            self.server_to_voice_client[context.guild.id] = None
+            player.voice_client = None
+            # the after callback does not run for a disconnected voice client
+            self._release_song(player.current_song_info)
+            player.current_song_info = None
+            self._release_pending_song(player)
+            self._stop_clock(context.guild.id)
 
     @commands.hybrid_command(
         name="loop",
@@ -696,8 +2302,10 @@ class YouTube(commands.Cog, name="youtube"):
         :param context: The application command context.
         """
         guild_id = context.guild.id
-        self.server_to_current_loop_status[guild_id] = not self.server_to_current_loop_status[guild_id]
-        status = "on" if self.server_to_current_loop_status[guild_id] else "off"
+        player = self._player(guild_id)
+        player.loop_status = not player.loop_status
+        self.sessions.mark(guild_id)
+        status = "on" if player.loop_status else "off"
         embed = discord.Embed(
             description=f"Loop status: {status}", color=0xE02B2B
         )
@@ -714,13 +2322,20 @@ class YouTube(commands.Cog, name="youtube"):
         :param context: The application command context.
         """
         guild_id = context.guild.id
-        song_info = self.server_to_current_song_info[guild_id]
+        player = self._player(guild_id)
+        song_info = player.current_song_info
 
         if song_info:
-            elapsed = self.server_to_timestamps.get(guild_id, 0)
+            elapsed = player.clock.elapsed
+            elapsed_text = self._format_time(elapsed)
+            duration = self._song_duration(song_info)
+            if duration:
+                elapsed_text += f" / {self._format_time(duration)}"
+            metadata = self.metadata.get(song_info.get('id'))
+            title = f"{metadata.title}\n" if metadata is not None and metadata.title else ""
             embed = discord.Embed(
                 title="Now Playing",
-                description=f"URL: {song_info['url']}\nElapsed time: {self._format_time(elapsed)}",
+                description=f"{title}URL: {song_info['url']}\nElapsed time: {elapsed_text}",
                 color=0xE02B2B
             )
             await context.send(embed=embed)
@@ -730,6 +2345,136 @@ class YouTube(commands.Cog, name="youtube"):
             )
             await context.send(embed=embed)
 
+    @commands.hybrid_command(
+        name="seek",
+        description="Jump to a position in the current audio.",
+    )
+    async def seek(self, context: Context, position: str) -> None:
+        """
+        This command jumps to a position in the current audio.
+
+        :param context: The application command context.
+        :param position: The position, as seconds, mm:ss or hh:mm:ss.
+        """
+        guild_id = context.guild.id
+        player = self._player(guild_id)
+        song_info = player.current_song_info
+        voice_client = player.voice_client
+        if song_info is None or voice_client is None or not voice_client.is_playing():
+            await context.send("No audio is currently playing.")
+            return
+
+        try:
+            seconds = 0.0
+            for part in position.strip().split(":"):
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            seconds = -1.0
+        duration = self._song_duration(song_info)
+        if seconds < 0 or (duration and seconds >= duration):
+            embed = discord.Embed(description=f"Invalid position: {position}", color=0xE02B2B)
+            await context.send(embed=embed)
+            return
+
+        await self._ensure_seek_index(song_info)
+        # swap the source of the running player, so that the after callback does not fire
+        previous_source = voice_client.source
+        voice_client.source = self._create_audio_source(song_info, timestamp=seconds)
+        previous_source.cleanup()
+        self._start_clock(guild_id, seconds)
+
+        embed = discord.Embed(description=f"Jumped to {self._format_time(seconds)}", color=0xE02B2B)
+        await context.send(embed=embed)
+
+    @commands.hybrid_command(
+        name="ytstats",
+        description="Show download scheduler statistics (owner only).",
+    )
+    @commands.is_owner()
+    async def ytstats(self, context: Context) -> None:
+        """
+        This command shows the download scheduler statistics, used to size download_concurrency.
+
+        :param context: The application command context.
+        """
+        if self.bot.ipc is None:
+            stats = await self._local_stats({})
+            title = "Download Scheduler"
+        else:
+            results = [result for result in (await self.bot.ipc.call("ytstats")).values() if result]
+            stats = self._merge_stats(results) if results else await self._local_stats({})
+            title = f"Download Scheduler ({len(results)} clusters)"
+        embed = discord.Embed(title=title, color=0xBEBEFE)
+        embed.add_field(name="Active", value=f"{stats['active']} / {stats['max_concurrent']}", inline=True)
+        embed.add_field(name="Waiting", value=str(stats['waiting']), inline=True)
+        embed.add_field(name="Started", value=str(stats['granted']), inline=True)
+        embed.add_field(
+            name="Queue wait",
+            value=f"avg {stats['avg_wait']:.2f}s / p95 {stats['p95_wait']:.2f}s / max {stats['max_wait']:.2f}s",
+            inline=False,
+        )
+        embed.add_field(
+            name="yt-dlp worker wait",
+            value=f"{stats['pool_waiting']} waiting, max {stats['pool_max_wait']:.2f}s",
+            inline=False,
+        )
+        embed.add_field(
+            name="Frame cache",
+            value=f"{stats['frame_cache_songs']} songs, {stats['frame_cache_bytes'] / 2**20:.1f} / {stats['frame_cache_max_bytes'] / 2**20:.0f} MiB",
+            inline=False,
+        )
+        embed.add_field(name="Players", value=str(stats['players']), inline=True)
+        embed.add_field(
+            name="Broadcasts",
+            value=f"{stats['broadcasts']} ffmpeg processes for {stats['broadcast_subscribers']} voice clients",
+            inline=False,
+        )
+        embed.add_field(name="Refused songs", value=str(stats['admission_rejected']), inline=True)
+        embed.add_field(
+            name="Disk",
+            value=f"{stats['disk_used_bytes'] / 2**20:.0f} / {stats['disk_max_bytes'] / 2**20:.0f} MiB used, "
+            f"{stats['disk_reserved_bytes'] / 2**20:.0f} MiB reserved for downloads",
+            inline=False,
+        )
+        await context.send(embed=embed)
+
+    async def _local_stats(self, args: dict) -> dict:
+        """
+        The statistics shown by ytstats for this process, also answered over IPC to the other clusters.
+
+        :param args: Unused.
+        """
+        stats = self.download_scheduler.stats()
+        stats.update(
+            frame_cache_songs=len(self.frame_cache),
+            frame_cache_bytes=self.frame_cache.total_bytes,
+            frame_cache_max_bytes=self.frame_cache.max_bytes,
+            players=len(self.players),
+            broadcasts=len(self.broadcasts),
+            broadcast_subscribers=self.broadcasts.subscribers,
+            admission_rejected=self.admission.rejected,
+            # the pool is the second queue of a download, after the scheduler
+            pool_waiting=self.ytdlp_pool.waiting if self.ytdlp_pool is not None else 0,
+            pool_max_wait=self.ytdlp_pool.max_wait if self.ytdlp_pool is not None else 0.0,
+            disk_used_bytes=self.quota.total_bytes,
+            disk_reserved_bytes=self.quota.reserved_bytes,
+            disk_max_bytes=self.quota.max_bytes,
+        )
+        return stats
+
+    @staticmethod
+    def _merge_stats(results: list[dict]) -> dict:
+        # the waits are per cluster: the average is weighted by the grants, the percentile is the worst one
+        merged = {key: sum(result[key] for result in results) for key in results[0] if not key.endswith("_wait")}
+        # the clusters share dldata/, every one of them sees the whole of it
+        for key in ("disk_used_bytes", "disk_max_bytes"):
+            merged[key] = max(result[key] for result in results)
+        merged["avg_wait"] = sum(r["avg_wait"] * r["granted"] for r in results) / max(merged["granted"], 1)
+        merged["p95_wait"] = max(r["p95_wait"] for r in results)
+        merged["max_wait"] = max(r["max_wait"] for r in results)
+        merged["pool_max_wait"] = max(r["pool_max_wait"] for r in results)
+        return merged
+
     @commands.hybrid_command(
         name="ythelp",
         description="ヘルプを表示します。/ Display help for YouTube cog.",
@@ -752,25 +2497,43 @@ class YouTube(commands.Cog, name="youtube"):
         help_text = {
             "en": {
                 "playnow": "Play the audio from the specified YouTube video immediately.",
-                "add": "Add the audio from the specified YouTube video to the queue.",
-                "queue": "Display the current queue.",
+                "add": "Add the audio from the specified YouTube videos to the queue, in the given order.",
+                "addbulk": "Add a pasted list or a text file of YouTube videos to the queue.",
+                "search": "Search YouTube by keywords and add one of the results to the queue.",
+                "playlist": "Add every video of the specified YouTube playlist to the queue.",
+                "queue": "Display the current queue, page by page.",
+                "remove": "Remove the song at the specified position from the queue.",
+                "move": "Move a song of the queue to another position.",
+                "insert": "Insert the audio from the specified YouTube video at a position in the queue.",
+                "shuffle": "Shuffle the queue.",
+                "dedupe": "Remove the duplicate songs from the queue.",
                 "skip": "Skip the currently playing audio.",
                 "stop": "Stop playing audio and reset the queue.",
                 "ytjoin": "Join a voice channel.",
                 "ytleave": "Leave the voice channel.",
                 "loop": "Toggle loop mode for the current audio.",
                 "nowplaying": "Show information about the currently playing audio.",
+                "seek": "Jump to a position in the current audio (seconds, mm:ss or hh:mm:ss).",
             },
             "jp": {
                 "playnow": "YouTubeのURLで指定した曲を再生します。",
-                "add": "YouTubeのURLで指定した動画を再生リストに追加します。",
-                "queue": "現在の再生リストを表示します。",
+                "add": "YouTubeのURLで指定した動画（複数可）を指定した順に再生リストに追加します。",
+                "addbulk": "貼り付けたリストまたはテキストファイルのYouTube動画を再生リストに追加します。",
+                "search": "キーワードでYouTubeを検索し、結果から選んだ曲を再生リストに追加します。",
+                "playlist": "YouTubeのプレイリストの動画をすべて再生リストに追加します。",
+                "queue": "現在の再生リストをページごとに表示します。",
+                "remove": "指定した位置の曲を再生リストから削除します。",
+                "move": "再生リストの曲を別の位置に移動します。",
+                "insert": "YouTubeのURLで指定した動画を再生リストの指定した位置に追加します。",
+                "shuffle": "再生リストをシャッフルします。",
+                "dedupe": "再生リストから重複した曲を削除します。",
                 "skip": "今流れている曲をスキップして次の曲に進みます。",
                 "stop": "曲の再生を停止し、再生リストを空にします。",
                 "ytjoin": "ボットがボイスチャンネルに入室します。",
                 "ytleave": "ボットがボイスチャンネルから退出します。",
                 "loop": "今の曲をループ再生するかどうかを切り替えます。",
                 "nowplaying": "現在再生中の曲の情報を表示します。",
+                "seek": "再生中の曲の指定した位置に移動します（秒、mm:ss または hh:mm:ss）。",
             }
         }
 
@@ -784,64 +2547,53 @@ class YouTube(commands.Cog, name="youtube"):
 
         await context.send(embed=embed)
 
-    async def _fetch_raw_video_async(self, url: str):
+    async def _fetch_raw_video_async(
+        self, url: str, max_filesize: int, on_progress: Union[Callable[[YtDlpProgress], None], None] = None
+    ) -> Union[YtDlpResult, None]:
         """
         This method downloads the YouTube video asynchronously.
 
         :param url: The url to the YouTube video.
+        :param max_filesize: yt-dlp refuses formats that are known to be larger, in bytes.
+        :param on_progress: Called with every progress update of the download.
         """
         self.bot.logger.info(f"[YouTube] [info] Start downloading {url}")
 
-        command = [
-            "yt-dlp",
-            url,
-            "--output", "%(id)s.%(ext)s",
-            "--format", "bestvideo+bestaudio/best",  # Changed to 'best' for standard quality
-            "--paths", self.video_download_dir,
-            "--merge-output-format", "mp4",
-            "--no-playlist",
-            "--no-keep-video",
-            "--no-part",
-            "--postprocessor-args", "-c:v copy -c:a aac -b:a 192k"
-        ]
-
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-
-        try:
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=600)
-            stdout, stderr = stdout.decode().strip(), stderr.decode().strip()
-
-            print(stdout)
-
-            if process.returncode == 0:
-                self.bot.logger.info(f"[YouTube] [info] Successfully downloaded {url}")
-
-                for line in stdout.split("\n"):
-                    if len(line) == 0:
-                        continue
-                    self.bot.logger.info(f"[YouTube] {line}")
-                    match_file_path = re.search(r'\[Merger\] Merging formats into(.+)', line)
-
-                    if match_file_path:
-                        file_path = match_file_path.group(1)[:-1]
-                        file_path = os.path.join(self.video_download_dir, os.path.basename(file_path))
-                        return file_path
-            else:
-                self.bot.logger.error(f"Failed to download video: <{url}>")
-                self.bot.logger.error(f"Error: {stderr}")
-                return None
-
-        except asyncio.TimeoutError:
-            self.bot.logger.error(f"Timeout while downloading video: <{url}>")
-            process.kill()
-            return None
-        except Exception as e:
-            self.bot.logger.error(f"Unexpected error while downloading video <{url}>: {str(e)}")
+        if self.ytdlp_pool is not None:
+            result = await self.ytdlp_pool.run(url, {
+                "format": "bestvideo+bestaudio/best",
+                "outtmpl": "%(id)s.%(ext)s",
+                "paths": {"home": self.video_download_dir},
+                "merge_output_format": "mp4",
+                "noplaylist": True,
+                "nopart": True,
+                "max_filesize": max_filesize,
+                "postprocessor_args": {"default": ["-c:v", "copy", "-c:a", "aac", "-b:a", "192k"]},
+                "quiet": True,
+                "noprogress": True,
+            }, on_progress=on_progress)
+        else:
+            command = [
+                "yt-dlp",
+                url,
+                "--output", "%(id)s.%(ext)s",
+                "--format", "bestvideo+bestaudio/best",  # Changed to 'best' for standard quality
+                "--paths", self.video_download_dir,
+                "--merge-output-format", "mp4",
+                "--no-playlist",
+                "--no-keep-video",
+                "--no-part",
+                "--max-filesize", str(max_filesize),
+                "--postprocessor-args", "-c:v copy -c:a aac -b:a 192k",
+                *structured_output_args(),
+            ]
+            result = await run_cli(command, on_progress=on_progress, logger=self.bot.logger)
+
+        if result is None or result.filepath is None:
+            self.bot.logger.error(f"Failed to download video: <{url}>")
             return None
+        self.bot.logger.info(f"[YouTube] [info] Successfully downloaded {url}")
+        return result
 
     @commands.hybrid_command(
         name="ytdownload",
@@ -853,24 +2605,28 @@ class YouTube(commands.Cog, name="youtube"):
             user = context.author
 
             url = url.strip()
-            await context.send("Start downloading...")
-            result = await self._fetch_raw_video_async(url)
-            if result is None:
+            status_message = await context.send("Start downloading...")
+            last_update = 0.0
+
+            def on_progress(progress: YtDlpProgress) -> None:
+                nonlocal last_update
+                if progress.fraction is None or time.monotonic() - last_update < 5:
+                    return
+                last_update = time.monotonic()
+                self.bot.loop.create_task(status_message.edit(content=f"Downloading... {progress.fraction:.0%}"))
+
+            # the same video requested concurrently is downloaded and uploaded only once
+            share_link = await self.video_flights.do(
+                self._extract_video_id(url) or url,
+                lambda: self._download_and_upload(url, context.guild.id if context.guild else 0, user.id, on_progress),
+            )
+            if share_link is None:
                 embed = discord.Embed(
                     description="Failed to fetch the video.", color=0xE02B2B
                 )
                 await context.send(embed=embed)
                 return
 
-            file_path = result
-            # print(f"file path: {file_path}")
-
-            # Upload to GigaFile
-            share_link = await self.upload_to_gigafile_async(file_path)
-
-            # Now it's safe to remove the file
-            await asyncio.to_thread(os.remove, file_path)
-
             # send the file to the user
             embed = discord.Embed(
                 title="YouTube Download Success",
@@ -895,6 +2651,41 @@ class YouTube(commands.Cog, name="youtube"):
             self.bot.logger.error(f"Error in ytdownload command: {str(e)}")
             await context.send("An error occurred while processing your request. Please try again later.")
 
+    async def _download_and_upload(
+        self, url: str, guild_id: int, user_id: int, on_progress: Union[Callable[[YtDlpProgress], None], None] = None
+    ) -> Union[str, None]:
+        """
+        This method downloads the YouTube video, uploads it to GigaFile and returns the download link.
+
+        :param url: The url to the YouTube video.
+        :param guild_id: The ID of the guild the video is for.
+        :param user_id: The ID of the member who requested the video.
+        :param on_progress: Called with every progress update of the download.
+        """
+        reserve = self.bot.config.get("video_download_reserve_mb", 512) * 2**20
+        if not await self._make_room(reserve):
+            self.bot.logger.warning(f"[YouTube] Not enough disk space to download the video {url}")
+            return None
+        async with self.download_scheduler.slot(guild_id, user_id):
+            started = time.monotonic()
+            # measured before the reservation, so that the download does not count against itself
+            max_filesize = self.quota.room()
+            with self.quota.reserve(reserve):
+                result = await self._fetch_raw_video_async(url, max_filesize, on_progress)
+        if result is None:
+            return None
+        self._observe_download("video", time.monotonic() - started, result.filepath)
+        self.quota.add(result.filepath)
+        await self._remember_metadata(result)
+        file_path = result.filepath
+
+        try:
+            # Upload to GigaFile
+            return await self.upload_to_gigafile_async(file_path)
+        finally:
+            # Now it's safe to remove the file, a failed deletion is retried by the reaper
+            self.quota.delete(file_path)
+
     def upload_to_gigafile(self, file_path: str, lifetime: int = 100) -> str:
         """
         This method uploads a file to GigaFile and returns the download link.
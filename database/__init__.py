@@ -95,3 +95,165 @@ class DatabaseManager:
             for row in result:
                 result_list.append(row)
             return result_list
+
+    async def get_cache_entries(self) -> list:
+        """
+        This function will get every entry of the audio cache index.
+
+        :return: A list of (video_id, path, size, hits, last_access, loudness, true_peak) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT c.video_id, c.path, c.size, c.hits, c.last_access, l.loudness, l.true_peak "
+            "FROM audio_cache c LEFT JOIN audio_loudness l ON l.video_id = c.video_id"
+        )
+        async with rows as cursor:
+            return list(await cursor.fetchall())
+
+    async def upsert_cache_entry(
+        self, video_id: str, path: str, size: int, hits: int, last_access: float
+    ) -> None:
+        """
+        This function will add or update an entry of the audio cache index.
+
+        :param video_id: The ID of the cached YouTube video.
+        :param path: The path of the cached file.
+        :param size: The size of the cached file in bytes.
+        :param hits: The number of times the file has been requested.
+        :param last_access: The UNIX time of the last request.
+        """
+        await self.connection.execute(
+            "INSERT OR REPLACE INTO audio_cache(video_id, path, size, hits, last_access) VALUES (?, ?, ?, ?, ?)",
+            (
+                video_id,
+                path,
+                size,
+                hits,
+                last_access,
+            ),
+        )
+        await self.connection.commit()
+
+    async def delete_cache_entry(self, video_id: str) -> None:
+        """
+        This function will remove an entry from the audio cache index.
+
+        :param video_id: The ID of the cached YouTube video.
+        """
+        await self.connection.execute(
+            "DELETE FROM audio_cache WHERE video_id=?", (video_id,)
+        )
+        await self.connection.execute(
+            "DELETE FROM audio_loudness WHERE video_id=?", (video_id,)
+        )
+        await self.connection.commit()
+
+    async def set_loudness(self, video_id: str, loudness: float, true_peak: float) -> None:
+        """
+        This function will store the loudness measurement of a cached file.
+
+        :param video_id: The ID of the cached YouTube video.
+        :param loudness: The integrated loudness in LUFS.
+        :param true_peak: The true peak in dBTP.
+        """
+        await self.connection.execute(
+            "INSERT OR REPLACE INTO audio_loudness(video_id, loudness, true_peak) VALUES (?, ?, ?)",
+            (
+                video_id,
+                loudness,
+                true_peak,
+            ),
+        )
+        await self.connection.commit()
+
+    async def get_video_metadata(self) -> list:
+        """
+        This function will get the metadata of every known video.
+
+        :return: A list of (video_id, title, duration, codec, fetched_at) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT video_id, title, duration, codec, fetched_at FROM video_metadata"
+        )
+        async with rows as cursor:
+            return list(await cursor.fetchall())
+
+    async def upsert_video_metadata(
+        self, video_id: str, title: str, duration: float, codec: str, fetched_at: float
+    ) -> None:
+        """
+        This function will add or update the metadata of a video.
+
+        :param video_id: The ID of the YouTube video.
+        :param title: The title of the video.
+        :param duration: The duration of the video in seconds.
+        :param codec: The audio codec of the video.
+        :param fetched_at: The UNIX time at which the metadata was fetched.
+        """
+        await self.connection.execute(
+            "INSERT OR REPLACE INTO video_metadata(video_id, title, duration, codec, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                video_id,
+                title,
+                duration,
+                codec,
+                fetched_at,
+            ),
+        )
+        await self.connection.commit()
+
+    async def delete_expired_video_metadata(self, before: float) -> None:
+        """
+        This function will remove the metadata fetched before the given time,
+        except that of cached audio, which is not fetched again.
+
+        :param before: The UNIX time before which metadata is expired.
+        """
+        await self.connection.execute(
+            "DELETE FROM video_metadata WHERE fetched_at < ? AND video_id NOT IN (SELECT video_id FROM audio_cache)",
+            (before,),
+        )
+        await self.connection.commit()
+
+    async def upsert_video_metadata_many(self, rows: list) -> None:
+        """
+        This function will add or update the metadata of several videos in one transaction.
+
+        :param rows: A list of (video_id, title, duration, codec, fetched_at) tuples.
+        """
+        await self.connection.executemany(
+            "INSERT OR REPLACE INTO video_metadata(video_id, title, duration, codec, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        await self.connection.commit()
+
+    async def get_player_sessions(self) -> list:
+        """
+        This function will get the saved playback session of every guild.
+
+        :return: A list of (guild_id, voice_channel_id, text_channel_id, current_song, position, loop_status, queue, updated_at) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT guild_id, voice_channel_id, text_channel_id, current_song, position, loop_status, queue, updated_at "
+            "FROM player_sessions"
+        )
+        async with rows as cursor:
+            return list(await cursor.fetchall())
+
+    async def save_player_sessions(self, rows: list, deleted: list) -> None:
+        """
+        This function will save and delete several playback sessions in one transaction.
+
+        :param rows: A list of (guild_id, voice_channel_id, text_channel_id, current_song, position, loop_status, queue, updated_at) tuples.
+        :param deleted: A list of (guild_id,) tuples of the sessions to delete.
+        """
+        if rows:
+            await self.connection.executemany(
+                "INSERT OR REPLACE INTO player_sessions(guild_id, voice_channel_id, text_channel_id, current_song, position, loop_status, queue, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        if deleted:
+            await self.connection.executemany(
+                "DELETE FROM player_sessions WHERE guild_id=?", deleted
+            )
+        await self.connection.commit()
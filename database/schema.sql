@@ -5,4 +5,36 @@ CREATE TABLE IF NOT EXISTS `warns` (
   `moderator_id` varchar(20) NOT NULL,
   `reason` varchar(255) NOT NULL,
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+CREATE TABLE IF NOT EXISTS `audio_cache` (
+  `video_id` varchar(20) NOT NULL PRIMARY KEY,
+  `path` varchar(255) NOT NULL,
+  `size` int(11) NOT NULL,
+  `hits` int(11) NOT NULL DEFAULT 0,
+  `last_access` real NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS `video_metadata` (
+  `video_id` varchar(20) NOT NULL PRIMARY KEY,
+  `title` varchar(255),
+  `duration` real,
+  `codec` varchar(20),
+  `fetched_at` real NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS `audio_loudness` (
+  `video_id` varchar(20) NOT NULL PRIMARY KEY,
+  `loudness` real NOT NULL,
+  `true_peak` real NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS `player_sessions` (
+  `guild_id` varchar(20) NOT NULL PRIMARY KEY,
+  `voice_channel_id` varchar(20) NOT NULL,
+  `text_channel_id` varchar(20),
+  `current_song` text,
+  `position` real NOT NULL DEFAULT 0,
+  `loop_status` int(1) NOT NULL DEFAULT 1,
+  `queue` text NOT NULL,
+  `updated_at` real NOT NULL
+);
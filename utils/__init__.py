@@ -0,0 +1,47 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+from utils.admission import AdmissionController
+from utils.broadcast import BroadcastHub, BroadcastSource
+from utils.cache import AudioCache
+from utils.clock import PlaybackClock, TimerQueue
+from utils.frames import BufferedOpusSource, FrameCache, OpusFrameBuffer, RecordingSource
+from utils.metadata import MetadataStore, VideoMetadata
+from utils.scheduler import DownloadScheduler
+from utils.seekindex import OggSeekIndex, OggSlice
+from utils.quota import DiskQuota
+from utils.search import SearchCache
+from utils.session import SessionStore
+from utils.singleflight import SingleFlight
+from utils.ytdlp import YtDlpProgress, YtDlpResult
+from utils.ytdlp_pool import YtDlpWorkerPool
+
+__all__ = [
+    "AdmissionController",
+    "AudioCache",
+    "BroadcastHub",
+    "BroadcastSource",
+    "BufferedOpusSource",
+    "DiskQuota",
+    "DownloadScheduler",
+    "FrameCache",
+    "MetadataStore",
+    "OggSeekIndex",
+    "OggSlice",
+    "OpusFrameBuffer",
+    "PlaybackClock",
+    "RecordingSource",
+    "SearchCache",
+    "SessionStore",
+    "SingleFlight",
+    "TimerQueue",
+    "VideoMetadata",
+    "YtDlpProgress",
+    "YtDlpResult",
+    "YtDlpWorkerPool",
+]
@@ -0,0 +1,136 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import math
+import time
+from typing import Hashable, Union
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity requests, refilled at rate requests per second.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: Union[float, None] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def available(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0.0) * self.rate)
+        self.updated = max(self.updated, now)
+        return self.tokens
+
+    def take(self, count: float, now: float) -> None:
+        self.tokens = self.available(now) - count
+
+    def retry_after(self, count: float, now: float) -> float:
+        missing = count - self.available(now)
+        return missing / self.rate if missing > 0 and self.rate > 0 else 0.0
+
+    def is_full(self, now: float) -> bool:
+        return self.available(now) >= self.capacity
+
+
+class AdmissionController:
+    """
+    Decides whether songs may be queued, before anything is downloaded for them: token bucket
+    rate limits per user and per guild, a maximum queue length, a maximum track duration and a
+    maximum total duration of the queue. Every check is a few dict lookups and comparisons.
+
+    A limit of 0 (or a rate of 0) disables it.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 0,
+        user_burst: int = 0,
+        guild_rate: float = 0,
+        guild_burst: int = 0,
+        max_queue_length: int = 0,
+        max_track_seconds: float = 0,
+        max_queued_seconds: float = 0,
+    ) -> None:
+        """
+        :param user_rate: The songs one member may queue per second, on average.
+        :param user_burst: The songs one member may queue at once.
+        :param guild_rate: The songs one guild may queue per second, on average.
+        :param guild_burst: The songs one guild may queue at once.
+        :param max_queue_length: The maximum number of songs in the queue of a guild.
+        :param max_track_seconds: The maximum duration of a song.
+        :param max_queued_seconds: The maximum total duration of the queue of a guild.
+        """
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self.max_queue_length = max_queue_length
+        self.max_track_seconds = max_track_seconds
+        self.max_queued_seconds = max_queued_seconds
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        # the number of songs refused so far, for statistics
+        self.rejected = 0
+
+    def check_song(self, duration: Union[float, None], queue_length: int, queued_seconds: float) -> Union[str, None]:
+        """
+        Returns why a song may not be queued, or None if it may.
+        A song whose duration is not known yet only counts against the queue length.
+
+        :param duration: The duration of the song, if known.
+        :param queue_length: The number of songs already in the queue.
+        :param queued_seconds: The known total duration of the queue.
+        """
+        if self.max_queue_length and queue_length >= self.max_queue_length:
+            return f"the queue is full ({self.max_queue_length} songs)"
+        if duration and self.max_track_seconds and duration > self.max_track_seconds:
+            return f"songs may be at most {self.max_track_seconds / 60:.0f} minutes long"
+        if duration and self.max_queued_seconds and queued_seconds + duration > self.max_queued_seconds:
+            return f"the queue may be at most {self.max_queued_seconds / 3600:.3g} hours long"
+        return None
+
+    def acquire(self, guild_id: int, user_id: int, count: int) -> tuple[int, float]:
+        """
+        Takes up to count tokens from the buckets of both the member and the guild.
+
+        :param guild_id: The ID of the guild.
+        :param user_id: The ID of the member.
+        :param count: The number of songs to queue.
+        :return: The number of songs granted and, if less than count, the seconds until the next one is.
+        """
+        now = time.monotonic()
+        buckets = []
+        if self.user_rate and self.user_burst:
+            buckets.append(self._bucket(("user", user_id), self.user_rate, self.user_burst, now))
+        if self.guild_rate and self.guild_burst:
+            buckets.append(self._bucket(("guild", guild_id), self.guild_rate, self.guild_burst, now))
+        granted = count
+        for bucket in buckets:
+            granted = min(granted, max(math.floor(bucket.available(now)), 0))
+        for bucket in buckets:
+            bucket.take(granted, now)
+        if granted == count:
+            return granted, 0.0
+        return granted, max(bucket.retry_after(1, now) for bucket in buckets)
+
+    def prune(self) -> None:
+        """
+        Drops the buckets that have refilled, they are the same as new ones.
+        """
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.is_full(now):
+                del self._buckets[key]
+
+    def _bucket(self, key: Hashable, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity, now)
+        return bucket
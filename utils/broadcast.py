@@ -0,0 +1,151 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import threading
+from typing import Callable, Hashable
+
+import discord
+
+
+class _Broadcast:
+    """
+    One opus source shared by several voice clients. The packets it produced last are kept
+    in a ring buffer, so subscribers that read a little behind, or join late, are served
+    without touching the source again.
+    """
+
+    __slots__ = ("key", "source", "ring", "produced", "ended", "subscribers", "lock")
+
+    def __init__(self, key: Hashable, source: discord.AudioSource, capacity: int) -> None:
+        self.key = key
+        self.source = source
+        self.ring = [b""] * capacity
+        self.produced = 0
+        self.ended = False
+        self.subscribers = 0
+        self.lock = threading.Lock()
+
+    @property
+    def joinable(self) -> bool:
+        # a new subscriber starts at the first packet, which must still be in the ring,
+        # and an ended broadcast would only give it silence
+        return not self.ended and self.produced < len(self.ring)
+
+    def read_at(self, position: int) -> tuple[bytes, int]:
+        """
+        Returns the packet at position and the position of the next one.
+        The subscriber that is furthest ahead pulls the next packet from the source.
+        """
+        with self.lock:
+            if position == self.produced:
+                if self.ended:
+                    return b"", position
+                packet = self.source.read()
+                if not packet:
+                    self.ended = True
+                    return b"", position
+                self.ring[self.produced % len(self.ring)] = packet
+                self.produced += 1
+            # a subscriber that fell further behind than the ring skips ahead
+            position = max(position, self.produced - len(self.ring))
+            return self.ring[position % len(self.ring)], position + 1
+
+
+class BroadcastSource(discord.AudioSource):
+    """
+    The audio source of one voice client subscribed to a broadcast.
+    """
+
+    def __init__(self, hub: "BroadcastHub", broadcast: _Broadcast) -> None:
+        self.hub = hub
+        self.broadcast = broadcast
+        self.position = 0
+
+    def read(self) -> bytes:
+        # cleanup() may run on the event loop thread while the voice thread is in here
+        broadcast = self.broadcast
+        if broadcast is None:
+            return b""
+        packet, self.position = broadcast.read_at(self.position)
+        if not packet and broadcast.ended:
+            self.hub.forget(broadcast)
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        broadcast, self.broadcast = self.broadcast, None
+        if broadcast is not None:
+            self.hub.unsubscribe(broadcast)
+
+
+class BroadcastHub:
+    """
+    Shares one ffmpeg process per (track, start offset) between every guild playing it,
+    so that the decoding and encoding work grows with the number of distinct tracks
+    instead of the number of guilds. A guild can join a broadcast until its first packet
+    leaves the ring buffer, i.e. for ring_packets * 20 ms after it started.
+    """
+
+    def __init__(self, ring_packets: int = 1500) -> None:
+        self.ring_packets = ring_packets
+        # the joinable broadcast of each key, and every broadcast that still has subscribers
+        self._broadcasts: dict[Hashable, _Broadcast] = {}
+        self._live: set[_Broadcast] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(broadcast.subscribers for broadcast in list(self._live))
+
+    def sources(self) -> list[discord.AudioSource]:
+        """
+        Returns the underlying source of every broadcast that still has subscribers.
+        """
+        with self._lock:
+            return [broadcast.source for broadcast in self._live]
+
+    def subscribe(self, key: Hashable, open_source: Callable[[], discord.AudioSource]) -> BroadcastSource:
+        """
+        Returns a source that plays the broadcast for key from its start, opening the
+        underlying opus source with open_source if no joinable broadcast exists.
+
+        :param key: Identifies the track, its gain and its start offset.
+        :param open_source: Creates the opus source of a new broadcast.
+        """
+        with self._lock:
+            broadcast = self._broadcasts.get(key)
+            if broadcast is None or not broadcast.joinable:
+                # a broadcast that is too far along keeps playing for its current subscribers
+                broadcast = _Broadcast(key, open_source(), self.ring_packets)
+                self._broadcasts[key] = broadcast
+                self._live.add(broadcast)
+            broadcast.subscribers += 1
+        return BroadcastSource(self, broadcast)
+
+    def forget(self, broadcast: _Broadcast) -> None:
+        """
+        Stops offering an ended broadcast to new subscribers. Its current subscribers keep it alive until they leave.
+        """
+        with self._lock:
+            if self._broadcasts.get(broadcast.key) is broadcast:
+                del self._broadcasts[broadcast.key]
+
+    def unsubscribe(self, broadcast: _Broadcast) -> None:
+        with self._lock:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers > 0:
+                return
+            self._live.discard(broadcast)
+            if self._broadcasts.get(broadcast.key) is broadcast:
+                del self._broadcasts[broadcast.key]
+        broadcast.source.cleanup()
@@ -0,0 +1,212 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import os
+import time
+from typing import Union
+
+
+class CacheEntry:
+    __slots__ = ("video_id", "path", "size", "hits", "last_access", "refs", "loudness", "true_peak", "seek_index")
+
+    def __init__(
+        self,
+        video_id: str,
+        path: str,
+        size: int,
+        hits: int = 0,
+        last_access: float = 0.0,
+        loudness: Union[float, None] = None,
+        true_peak: Union[float, None] = None,
+    ) -> None:
+        self.video_id = video_id
+        self.path = path
+        self.size = size
+        self.hits = hits
+        self.last_access = last_access
+        self.refs = 0
+        # EBU R128 measurement, filled in once by a background analysis pass
+        self.loudness = loudness
+        self.true_peak = true_peak
+        # built in memory on the first seek into the file
+        self.seek_index = None
+
+
+class AudioCache:
+    """
+    Content-addressed cache of downloaded audio files, keyed by the YouTube video ID.
+
+    Every guild that plays or queues a file holds a reference to it, and eviction only
+    ever removes files that nobody references. The index is persisted in the bot database
+    so that the cache survives restarts.
+    """
+
+    POLICIES = ("lru", "lfu")
+
+    def __init__(
+        self, max_bytes: int, policy: str = "lru", database=None, logger=None, pin_seconds: float = 0, quota=None
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # files modified this recently are never evicted, other processes sharing the
+        # directory keep the files they use fresh (see YouTube._reap)
+        self.pin_seconds = pin_seconds
+        # the DiskQuota that evicted files are deleted through, if any
+        self.quota = quota
+        self.database = database
+        self.logger = logger
+        self.entries: dict[str, CacheEntry] = {}
+        self.total_bytes = 0
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.entries
+
+    async def load(self) -> None:
+        """
+        Loads the cache index from the database, dropping entries whose file has disappeared.
+        """
+        if self.database is None:
+            return
+        for video_id, path, size, hits, last_access, loudness, true_peak in await self.database.get_cache_entries():
+            if not os.path.isfile(path):
+                await self.database.delete_cache_entry(video_id)
+                continue
+            self.entries[video_id] = CacheEntry(video_id, path, size, hits, last_access, loudness, true_peak)
+            self.total_bytes += size
+        if self.logger:
+            self.logger.info(
+                f"[AudioCache] Loaded {len(self.entries)} entries ({self.total_bytes / 2**20:.1f} MiB)."
+            )
+        await self.evict()
+
+    async def lookup(self, video_id: str) -> Union[str, None]:
+        """
+        Returns the path of a cached file and takes a reference to it, or None on a miss.
+
+        :param video_id: The ID of the YouTube video.
+        """
+        entry = self.entries.get(video_id)
+        if entry is None:
+            return None
+        if not os.path.isfile(entry.path):
+            await self._drop(entry)
+            return None
+        self.acquire(video_id)
+        await self._save(entry)
+        return entry.path
+
+    async def store(self, video_id: str, path: str) -> str:
+        """
+        Registers a freshly downloaded file and takes a reference to it.
+
+        :param video_id: The ID of the YouTube video.
+        :param path: The path of the downloaded file.
+        """
+        size = os.path.getsize(path)
+        entry = self.entries.get(video_id)
+        if entry is None:
+            entry = CacheEntry(video_id, path, size)
+            self.entries[video_id] = entry
+        else:
+            self.total_bytes -= entry.size
+            if entry.path != path:
+                entry.loudness = entry.true_peak = entry.seek_index = None
+                # e.g. an .opus download replacing an older .mp3; a file still being played
+                # is left to the orphan collection, which no longer sees it referenced
+                if entry.refs == 0:
+                    self._delete_file(entry.path)
+            entry.path, entry.size = path, size
+        self.total_bytes += size
+        self.acquire(video_id)
+        await self._save(entry)
+        await self.evict()
+        return path
+
+    async def set_loudness(self, video_id: str, loudness: float, true_peak: float) -> None:
+        entry = self.entries.get(video_id)
+        if entry is None:
+            return
+        entry.loudness, entry.true_peak = loudness, true_peak
+        if self.database is not None:
+            await self.database.set_loudness(video_id, loudness, true_peak)
+
+    def acquire(self, video_id: str) -> None:
+        entry = self.entries[video_id]
+        entry.refs += 1
+        entry.hits += 1
+        entry.last_access = time.time()
+
+    def release(self, video_id: str) -> None:
+        entry = self.entries.get(video_id)
+        if entry is not None and entry.refs > 0:
+            entry.refs -= 1
+
+    async def evict(self) -> None:
+        """
+        Removes unreferenced files until the cache fits in its budget.
+        """
+        if self.total_bytes > self.max_bytes:
+            await self.shrink(self.total_bytes - self.max_bytes)
+
+    async def shrink(self, nbytes: int) -> int:
+        """
+        Removes unreferenced files, in the order of the eviction policy, until nbytes are freed
+        or nothing else can be removed.
+
+        :param nbytes: The number of bytes to free.
+        :return: The number of bytes freed.
+        """
+        if nbytes <= 0:
+            return 0
+        if self.policy == "lfu":
+            candidates = sorted(self.entries.values(), key=lambda e: (e.hits, e.last_access))
+        else:
+            candidates = sorted(self.entries.values(), key=lambda e: e.last_access)
+        freed = 0
+        for entry in candidates:
+            if freed >= nbytes:
+                break
+            if entry.refs > 0:
+                continue
+            if self.pin_seconds:
+                try:
+                    if time.time() - os.path.getmtime(entry.path) < self.pin_seconds:
+                        continue
+                except OSError:
+                    pass
+            if not self._delete_file(entry.path):
+                continue
+            await self._drop(entry)
+            freed += entry.size
+            if self.logger:
+                self.logger.info(f"[AudioCache] Evicted {entry.video_id} ({entry.size / 2**20:.1f} MiB).")
+        return freed
+
+    def _delete_file(self, path: str) -> bool:
+        # through the quota when there is one, so that it stops counting the file
+        if self.quota is not None:
+            return self.quota.delete(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return True
+
+    async def _drop(self, entry: CacheEntry) -> None:
+        self.entries.pop(entry.video_id, None)
+        self.total_bytes -= entry.size
+        if self.database is not None:
+            await self.database.delete_cache_entry(entry.video_id)
+
+    async def _save(self, entry: CacheEntry) -> None:
+        if self.database is not None:
+            await self.database.upsert_cache_entry(
+                entry.video_id, entry.path, entry.size, entry.hits, entry.last_access
+            )
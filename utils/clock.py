@@ -0,0 +1,145 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Hashable, Union
+
+
+class PlaybackClock:
+    """
+    The position in the current song, computed on demand from a monotonic start time
+    and the offset playback started from, minus the time spent paused.
+    """
+
+    __slots__ = ("started_at", "offset", "paused_at")
+
+    def __init__(self) -> None:
+        self.started_at = None
+        self.offset = 0.0
+        self.paused_at = None
+
+    @property
+    def running(self) -> bool:
+        return self.started_at is not None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return self.offset + now - self.started_at
+
+    def start(self, position: float = 0.0) -> None:
+        """
+        Starts (or seeks) the clock at position.
+
+        :param position: The position playback starts from, in seconds.
+        """
+        self.started_at = time.monotonic()
+        self.offset = position
+        self.paused_at = None
+
+    def stop(self) -> None:
+        self.started_at = self.paused_at = None
+        self.offset = 0.0
+
+    def pause(self) -> None:
+        if self.started_at is not None and self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self) -> None:
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+
+class TimerQueue:
+    """
+    Runs delayed callbacks for every guild from a single task that sleeps until the earliest
+    deadline, so that nothing wakes up while nothing is due. Timers are keyed, and scheduling
+    a key again replaces its previous timer.
+    """
+
+    def __init__(self, logger=None) -> None:
+        self.logger = logger
+        self._heap: list[tuple[float, int, Hashable]] = []
+        # key -> (deadline, sequence number, callback), the heap may still hold replaced timers
+        self._timers: dict[Hashable, tuple[float, int, Callable[[], Awaitable]]] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Union[asyncio.Task, None] = None
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._timers.clear()
+        self._heap.clear()
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], Awaitable]) -> None:
+        """
+        Runs callback() as a task after delay seconds, unless the timer is cancelled or replaced first.
+
+        :param key: Identifies the timer.
+        :param delay: The delay in seconds.
+        :param callback: A coroutine function without arguments.
+        """
+        deadline = time.monotonic() + delay
+        sequence = next(self._sequence)
+        self._timers[key] = (deadline, sequence, callback)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+        if len(self._heap) > 2 * len(self._timers) + 64:
+            # drop the entries of replaced and cancelled timers
+            self._heap = [(d, s, k) for d, s, k in self._heap if self._timers.get(k, (None, None))[1] == s]
+            heapq.heapify(self._heap)
+        if self._heap[0][1] == sequence:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> None:
+        self._timers.pop(key, None)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap:
+                deadline, sequence, key = self._heap[0]
+                timer = self._timers.get(key)
+                if timer is not None and timer[1] == sequence and deadline > now:
+                    break
+                heapq.heappop(self._heap)
+                if timer is None or timer[1] != sequence:
+                    continue  # cancelled or replaced
+                del self._timers[key]
+                loop.create_task(self._fire(key, timer[2]))
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, key: Hashable, callback: Callable[[], Awaitable]) -> None:
+        try:
+            await callback()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"[TimerQueue] The timer {key} failed: {type(e).__name__}: {e}")
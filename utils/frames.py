@@ -0,0 +1,132 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Union
+
+import discord
+
+
+class OpusFrameBuffer:
+    """
+    The opus packets of one track, stored back to back in a single bytearray
+    with an array of offsets instead of one bytes object per 20 ms packet.
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.offsets = array("I", [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+    def append(self, packet: bytes) -> None:
+        self.data += packet
+        self.offsets.append(len(self.data))
+
+    def packet(self, index: int) -> bytes:
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+
+class FrameCache:
+    """
+    Completed OpusFrameBuffers keyed by track (and gain), bounded by a memory budget
+    with least recently used eviction. Safe to use from the voice player threads.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._buffers: OrderedDict[str, OpusFrameBuffer] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def get(self, key: str) -> Union[OpusFrameBuffer, None]:
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                self._buffers.move_to_end(key)
+            return buffer
+
+    def put(self, key: str, buffer: OpusFrameBuffer) -> None:
+        with self._lock:
+            old = self._buffers.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self._buffers[key] = buffer
+            self.total_bytes += buffer.nbytes
+            while self.total_bytes > self.max_bytes and len(self._buffers) > 1:
+                _, evicted = self._buffers.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+
+class RecordingSource(discord.AudioSource):
+    """
+    Wraps an opus source and records its packets. When the source reaches its end,
+    the complete recording is handed to on_complete. Recording is abandoned, but playback
+    continues, once the recording grows past max_bytes.
+    """
+
+    def __init__(
+        self, source: discord.AudioSource, max_bytes: int, on_complete: Callable[[OpusFrameBuffer], None]
+    ) -> None:
+        self.source = source
+        self.max_bytes = max_bytes
+        self.on_complete = on_complete
+        self.buffer = OpusFrameBuffer()
+
+    def read(self) -> bytes:
+        packet = self.source.read()
+        if self.buffer is None:
+            return packet
+        if not packet:
+            buffer, self.buffer = self.buffer, None
+            if len(buffer):
+                self.on_complete(buffer)
+            return packet
+        self.buffer.append(packet)
+        if self.buffer.nbytes > self.max_bytes:
+            self.buffer = None
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        self.buffer = None
+        self.source.cleanup()
+
+
+class BufferedOpusSource(discord.AudioSource):
+    """
+    Plays an OpusFrameBuffer from memory: no subprocess, no decoding and no encoding.
+    """
+
+    def __init__(self, buffer: OpusFrameBuffer, start: int = 0) -> None:
+        self.buffer = buffer
+        self.position = start
+
+    def read(self) -> bytes:
+        if self.position >= len(self.buffer):
+            return b""
+        packet = self.buffer.packet(self.position)
+        self.position += 1
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
@@ -0,0 +1,203 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import itertools
+import json
+from typing import Any, Awaitable, Callable, Union
+
+# a cluster that does not answer within this many seconds is left out of the results
+CALL_TIMEOUT = 10
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+
+
+class IpcServer:
+    """
+    The hub of the local IPC channel between cluster.py and its bot processes.
+
+    Every bot process connects with the shared token and its cluster ID. A call from one
+    cluster is forwarded to every connected cluster (including the caller), and the caller
+    gets back the results keyed by cluster ID. Messages are JSON lines over a localhost socket.
+    """
+
+    def __init__(self, token: str, host: str = "127.0.0.1", port: int = 0, logger=None) -> None:
+        self.token = token
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self.clusters: dict[int, asyncio.StreamWriter] = {}
+        # request id -> (future, results so far, clusters expected to answer)
+        self._pending: dict[int, tuple[asyncio.Future, dict, set]] = {}
+        self._ids = itertools.count()
+        self._server: Union[asyncio.AbstractServer, None] = None
+
+    async def start(self) -> int:
+        """
+        Starts listening and returns the port, which is picked by the OS if port is 0.
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def call(self, command: str, args: dict) -> dict[int, Any]:
+        """
+        Runs a command on every connected cluster and returns the results keyed by cluster ID.
+
+        :param command: The name of the command handler.
+        :param args: The JSON serializable arguments of the command.
+        """
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        results, expected = {}, set(self.clusters)
+        self._pending[request_id] = (future, results, expected)
+        for cluster_id, writer in list(self.clusters.items()):
+            try:
+                await _send(writer, {"op": "command", "id": request_id, "command": command, "args": args})
+            except (ConnectionError, RuntimeError):
+                expected.discard(cluster_id)
+        if expected and not set(results) >= expected:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        self._pending.pop(request_id, None)
+        return dict(results)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cluster_id = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("op") != "register" or hello.get("token") != self.token:
+                return
+            cluster_id = int(hello["cluster"])
+            self.clusters[cluster_id] = writer
+            if self.logger:
+                self.logger.info(f"[IPC] Cluster {cluster_id} connected.")
+
+            async for line in reader:
+                message = json.loads(line)
+                if message["op"] == "reply":
+                    pending = self._pending.get(message["id"])
+                    if pending is None:
+                        continue
+                    future, results, expected = pending
+                    results[cluster_id] = message.get("result")
+                    if not future.done() and set(results) >= expected:
+                        future.set_result(None)
+                elif message["op"] == "call":
+                    # answered from a task so that the replies of the other clusters keep flowing
+                    asyncio.get_running_loop().create_task(self._answer(writer, message))
+        except (ConnectionError, ValueError, KeyError, asyncio.CancelledError):
+            pass
+        finally:
+            if cluster_id is not None and self.clusters.get(cluster_id) is writer:
+                del self.clusters[cluster_id]
+                if self.logger:
+                    self.logger.info(f"[IPC] Cluster {cluster_id} disconnected.")
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, message: dict) -> None:
+        results = await self.call(message["command"], message.get("args") or {})
+        try:
+            await _send(writer, {"op": "result", "id": message["id"], "results": {str(k): v for k, v in results.items()}})
+        except (ConnectionError, RuntimeError):
+            pass
+
+
+class IpcClient:
+    """
+    The connection of one bot process to the IPC hub of cluster.py.
+    Cogs register handlers that the other clusters can call, e.g. for statistics.
+    """
+
+    def __init__(self, cluster_id: int, port: int, token: str, host: str = "127.0.0.1", logger=None) -> None:
+        self.cluster_id = cluster_id
+        self.host = host
+        self.port = port
+        self.token = token
+        self.logger = logger
+        self.handlers: dict[str, Callable[[dict], Awaitable[Any]]] = {}
+        self._writer: Union[asyncio.StreamWriter, None] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._task: Union[asyncio.Task, None] = None
+
+    def register(self, command: str, handler: Callable[[dict], Awaitable[Any]]) -> None:
+        """
+        :param command: The name the other clusters call the handler by.
+        :param handler: A coroutine function taking the arguments dict and returning a JSON serializable result.
+        """
+        self.handlers[command] = handler
+
+    def unregister(self, command: str) -> None:
+        self.handlers.pop(command, None)
+
+    async def connect(self) -> None:
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        await _send(self._writer, {"op": "register", "token": self.token, "cluster": self.cluster_id})
+        self._task = asyncio.get_running_loop().create_task(self._read(reader))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def call(self, command: str, **args) -> dict[int, Any]:
+        """
+        Runs a command on every cluster, this one included, and returns the results keyed by cluster ID.
+
+        :param command: The name of the command handler.
+        """
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await _send(self._writer, {"op": "call", "id": request_id, "command": command, "args": args})
+            results = await asyncio.wait_for(future, timeout=CALL_TIMEOUT * 2)
+        finally:
+            self._pending.pop(request_id, None)
+        return {int(cluster_id): result for cluster_id, result in results.items()}
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message["op"] == "command":
+                    asyncio.get_running_loop().create_task(self._run(message))
+                elif message["op"] == "result":
+                    future = self._pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message["results"])
+        except (ConnectionError, ValueError, KeyError) as e:
+            if self.logger:
+                self.logger.error(f"[IPC] Lost the connection to the cluster launcher: {e}")
+        if self.logger:
+            self.logger.warning("[IPC] The cluster launcher closed the connection.")
+
+    async def _run(self, message: dict) -> None:
+        handler = self.handlers.get(message["command"])
+        try:
+            result = await handler(message.get("args") or {}) if handler is not None else None
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"[IPC] The handler of {message['command']} failed: {e}")
+            result = None
+        try:
+            await _send(self._writer, {"op": "reply", "id": message["id"], "result": result})
+        except (ConnectionError, RuntimeError):
+            pass
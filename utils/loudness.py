@@ -0,0 +1,66 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import json
+import math
+from typing import Union
+
+# never push the true peak of a normalized track above this level
+PEAK_CEILING = -1.0
+
+
+async def analyze_loudness(path: str, timeout: float = 300) -> Union[tuple[float, float], None]:
+    """
+    Measures the EBU R128 integrated loudness and the true peak of a file with ffmpeg's loudnorm filter.
+
+    :param path: The path of the audio file.
+    :param timeout: The number of seconds after which ffmpeg is killed.
+    :return: (integrated loudness in LUFS, true peak in dBTP), or None if the file could not be measured.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-nostats", "-i", path,
+        "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        process.kill()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return None
+    if process.returncode != 0:
+        return None
+
+    # the measurement is the last JSON object that loudnorm prints
+    output = stderr.decode(errors="replace")
+    start = output.rfind("{")
+    if start == -1:
+        return None
+    try:
+        measurement = json.loads(output[start:output.rfind("}") + 1])
+        loudness, true_peak = float(measurement["input_i"]), float(measurement["input_tp"])
+    except (ValueError, KeyError):
+        return None
+    if not math.isfinite(loudness) or not math.isfinite(true_peak):
+        return None  # silence
+    return loudness, true_peak
+
+
+def normalization_gain(loudness: float, true_peak: float, target: float) -> float:
+    """
+    Returns the linear gain that brings a track to the target loudness without clipping.
+
+    :param loudness: The integrated loudness of the track in LUFS.
+    :param true_peak: The true peak of the track in dBTP.
+    :param target: The target loudness in LUFS.
+    """
+    gain_db = min(target - loudness, PEAK_CEILING - true_peak)
+    return 10 ** (gain_db / 20)
@@ -0,0 +1,113 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Union
+
+
+class VideoMetadata(NamedTuple):
+    id: str
+    title: Union[str, None]
+    duration: Union[float, None]
+    codec: Union[str, None]
+    fetched_at: float
+
+
+class MetadataStore:
+    """
+    Titles, durations and codecs of videos, keyed by video ID.
+
+    Entries live in memory (least recently used ones are dropped past max_entries) and are
+    written through to the database, and expire after ttl seconds in both places.
+
+    Pinned entries never expire nor are dropped: the metadata of cached audio is not fetched
+    again as long as the file plays from the cache.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 10000,
+        database=None,
+        pinned: Union[Callable[[str], bool], None] = None,
+    ) -> None:
+        """
+        :param ttl: The number of seconds after which metadata expires.
+        :param max_entries: The number of entries kept in memory.
+        :param database: The DatabaseManager to write the entries through to.
+        :param pinned: Tells whether the metadata of a video must be kept, e.g. because its audio is cached.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.database = database
+        self.pinned = pinned or (lambda video_id: False)
+        self.entries: OrderedDict[str, VideoMetadata] = OrderedDict()
+
+    def __contains__(self, video_id: str) -> bool:
+        return self.get(video_id) is not None
+
+    async def load(self) -> None:
+        if self.database is None:
+            return
+        expiry = time.time() - self.ttl
+        await self.database.delete_expired_video_metadata(expiry)
+        for row in await self.database.get_video_metadata():
+            self._remember(VideoMetadata(*row))
+
+    def get(self, video_id: Union[str, None]) -> Union[VideoMetadata, None]:
+        """
+        Returns the metadata of a video if it is known and fresh. Never touches the network.
+
+        :param video_id: The ID of the YouTube video.
+        """
+        metadata = self.entries.get(video_id)
+        if metadata is None:
+            return None
+        if time.time() - metadata.fetched_at > self.ttl and not self.pinned(video_id):
+            del self.entries[video_id]
+            return None
+        self.entries.move_to_end(video_id)
+        return metadata
+
+    async def put(self, video_id: str, title: Union[str, None], duration: Union[float, None], codec: Union[str, None]) -> None:
+        """
+        Records the metadata of a video, typically as a side effect of a yt-dlp call.
+
+        :param video_id: The ID of the YouTube video.
+        :param title: The title of the video.
+        :param duration: The duration of the video in seconds.
+        :param codec: The audio codec of the video.
+        """
+        metadata = VideoMetadata(video_id, title, duration, codec, time.time())
+        self._remember(metadata)
+        if self.database is not None:
+            await self.database.upsert_video_metadata(*metadata)
+
+    async def put_many(self, items: list) -> None:
+        """
+        Records the metadata of several videos at once, e.g. the entries of a playlist page.
+
+        :param items: A list of (video_id, title, duration, codec) tuples.
+        """
+        now = time.time()
+        rows = [VideoMetadata(video_id, title, duration, codec, now) for video_id, title, duration, codec in items]
+        for metadata in rows:
+            self._remember(metadata)
+        if self.database is not None and rows:
+            await self.database.upsert_video_metadata_many(rows)
+
+    def _remember(self, metadata: VideoMetadata) -> None:
+        self.entries[metadata.id] = metadata
+        self.entries.move_to_end(metadata.id)
+        while len(self.entries) > self.max_entries:
+            victim = next((video_id for video_id in self.entries if not self.pinned(video_id)), None)
+            if victim is None:
+                self.entries.popitem(last=False)
+            else:
+                del self.entries[victim]
@@ -0,0 +1,243 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import abc
+import asyncio
+import bisect
+import math
+import time
+from typing import Callable, Iterable, Union
+
+from aiohttp import web
+
+Labels = tuple[str, ...]  # the label values of a sample, in the order of the label names
+
+
+def _format_labels(names: tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return lines
+
+    @abc.abstractmethod
+    def samples(self) -> list[str]:
+        """
+        Returns the sample lines of the metric, without the HELP and TYPE comments.
+        """
+
+
+class Gauge(_Metric):
+    """
+    A value set by the code, or read at scrape time from a callback returning either a number
+    or (label values, value) pairs.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Union[Callable[[], Union[float, Iterable[tuple[Labels, float]]]], None] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[Labels, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        values = self.values
+        if self.callback is not None:
+            result = self.callback()
+            values = {(): result} if isinstance(result, (int, float)) else dict(result)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items()
+            if value is not None and not math.isnan(value)
+        ]
+
+
+class Counter(Gauge):
+    """
+    A value that only goes up, incremented by the code or read from a callback like a Gauge.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, buckets: Iterable[float], labelnames: Iterable[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [count per bucket (not cumulative), sum, count]
+        self.values: dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of the bot, rendered in the Prometheus text exposition format.
+    Registering a name again replaces the metric, so that a reloaded cog starts afresh.
+    """
+
+    def __init__(self, const_labels: Union[dict, None] = None) -> None:
+        self.metrics: dict[str, _Metric] = {}
+        self.const_labels = const_labels or {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        self.metrics.pop(name, None)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Iterable[float], labelnames: Iterable[str] = ()
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines += metric.render()
+            except Exception as e:
+                # one broken callback must not take the whole scrape down
+                lines.append(f"# {metric.name} failed: {_escape(e)}")
+        if self.const_labels:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in self.const_labels.items())
+            lines = [line if line.startswith("#") else _add_labels(line, labels) for line in lines]
+        return "\n".join(lines) + "\n"
+
+
+def _add_labels(line: str, labels: str) -> str:
+    name, value = line.rsplit(" ", 1)
+    if name.endswith("}"):
+        return f"{name[:-1]},{labels}}} {value}"
+    return f"{name}{{{labels}}} {value}"
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a sleep, i.e. how long callbacks block it.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task: Union[asyncio.Task, None] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.monotonic() - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics from a registry over a local aiohttp server.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464, logger=None) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self._runner: Union[web.AppRunner, None] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        if self.logger:
+            self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
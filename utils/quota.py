@@ -0,0 +1,179 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import contextlib
+import os
+import shutil
+
+
+class DiskQuota:
+    """
+    The disk budget of the download directory.
+
+    The size of every file under the root is tracked in memory: downloads are added when they
+    finish and deletions go through delete(), so the hot path never lists a directory. A full
+    scan only runs at startup and from the reaper, to pick up what other processes changed.
+    Downloads in progress hold a reservation of their expected size.
+
+    Above the high watermark the owner should evict files until the usage is back under the
+    low watermark. Downloads that would not fit, either in the budget or in the free space of
+    the disk minus a safety margin, are refused.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        high_watermark: float = 0.9,
+        low_watermark: float = 0.75,
+        min_free_bytes: int = 0,
+        logger=None,
+    ) -> None:
+        """
+        :param root: The directory to track, recursively.
+        :param max_bytes: The budget of the directory.
+        :param high_watermark: The fraction of the budget above which files should be evicted.
+        :param low_watermark: The fraction of the budget eviction brings the usage back to.
+        :param min_free_bytes: The free space that must be left on the disk.
+        :param logger: The logger to report failed deletions to.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_bytes
+        self.logger = logger
+        self.sizes: dict[str, int] = {}
+        self.total_bytes = 0
+        self.reserved_bytes = 0
+        # files that could not be deleted, retried by retry_deletes
+        self.leaked: set[str] = set()
+
+    def __contains__(self, path: str) -> bool:
+        return os.path.realpath(path) in self.sizes
+
+    @staticmethod
+    def scan(root: str) -> dict[str, int]:
+        """
+        Returns the size of every file under root. Blocking, run it in a thread.
+
+        :param root: The directory to scan.
+        """
+        sizes = {}
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.realpath(os.path.join(directory, name))
+                try:
+                    sizes[path] = os.stat(path).st_size
+                except OSError:
+                    continue
+        return sizes
+
+    def replace(self, sizes: dict[str, int]) -> None:
+        """
+        Replaces the tracked sizes with the result of a scan.
+
+        :param sizes: The sizes returned by scan.
+        """
+        self.sizes = sizes
+        self.total_bytes = sum(sizes.values())
+
+    def add(self, path: str) -> None:
+        """
+        Tracks a file that has just been written, or its new size.
+
+        :param path: The path of the file.
+        """
+        path = os.path.realpath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self.total_bytes += size - self.sizes.get(path, 0)
+        self.sizes[path] = size
+
+    def delete(self, path: str) -> bool:
+        """
+        Deletes a file and stops tracking it. A file that cannot be deleted stays tracked,
+        and is retried by retry_deletes, so that it is not silently leaked.
+
+        :param path: The path of the file.
+        :return: Whether the file is gone.
+        """
+        path = os.path.realpath(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.leaked.add(path)
+            if self.logger:
+                self.logger.warning(f"[DiskQuota] Failed to delete {path}: {e}")
+            return False
+        self.leaked.discard(path)
+        self.total_bytes -= self.sizes.pop(path, 0)
+        return True
+
+    def retry_deletes(self) -> int:
+        """
+        Retries the deletions that failed and returns the number of files still left.
+        """
+        for path in list(self.leaked):
+            self.delete(path)
+        return len(self.leaked)
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes: int):
+        """
+        Accounts for the expected size of a download while it runs.
+
+        :param nbytes: The expected size in bytes.
+        """
+        self.reserved_bytes += nbytes
+        try:
+            yield
+        finally:
+            self.reserved_bytes -= nbytes
+
+    @property
+    def used_bytes(self) -> int:
+        return self.total_bytes + self.reserved_bytes
+
+    def room(self) -> int:
+        """
+        Returns the number of bytes that can still be written, within the budget and the free disk space.
+        """
+        try:
+            disk_free = shutil.disk_usage(self.root).free - self.min_free_bytes - self.reserved_bytes
+        except OSError:
+            disk_free = self.max_bytes
+        return max(min(self.max_bytes - self.used_bytes, disk_free), 0)
+
+    def can_fit(self, nbytes: int) -> bool:
+        return nbytes <= self.room()
+
+    def excess(self, nbytes: int = 0) -> int:
+        """
+        Returns the number of bytes to evict before writing nbytes: nothing while the usage stays
+        under the high watermark, otherwise enough to get back under the low watermark.
+
+        :param nbytes: The size of the next download.
+        """
+        used = self.used_bytes + nbytes
+        if used <= self.high_watermark * self.max_bytes and self.can_fit(nbytes):
+            return 0
+        return max(int(used - self.low_watermark * self.max_bytes), nbytes - self.room(), 0)
+
+    def stats(self) -> dict:
+        return {
+            "used_bytes": self.total_bytes,
+            "reserved_bytes": self.reserved_bytes,
+            "max_bytes": self.max_bytes,
+            "files": len(self.sizes),
+            "leaked": len(self.leaked),
+        }
@@ -0,0 +1,106 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import os
+import signal
+import time
+from typing import Iterable
+
+
+def list_child_processes(names: Iterable[str]) -> list[tuple[int, str, float]]:
+    """
+    Lists the direct child processes of the bot with one of the given names, from /proc.
+    Returns an empty list where /proc is not available.
+
+    :param names: The process names (as in /proc/<pid>/comm), e.g. "ffmpeg".
+    :return: (pid, name, age in seconds) of every matching child.
+    """
+    names = set(names)
+    parent = os.getpid()
+    try:
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return []
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+
+    children = []
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as file:
+                stat = file.read()
+        except OSError:
+            continue  # exited in the meantime
+        # the name is in parentheses and may itself contain spaces or parentheses
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        if int(fields[1]) != parent or name not in names:
+            continue
+        children.append((pid, name, uptime - int(fields[19]) / clock_ticks))
+    return children
+
+
+def kill_stray_processes(names: Iterable[str], known_pids: set[int], min_age: float, logger=None) -> int:
+    """
+    Kills the child processes with one of the given names that nothing owns any more:
+    not in known_pids and older than min_age, which must exceed the timeout of every legitimate job.
+
+    :param names: The process names to look for.
+    :param known_pids: The PIDs of the processes that are still in use.
+    :param min_age: The minimum age in seconds of a stray process.
+    :param logger: The logger to report kills to.
+    """
+    killed = 0
+    for pid, name, age in list_child_processes(names):
+        if pid in known_pids or age < min_age:
+            continue
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            continue
+        killed += 1
+        if logger:
+            logger.warning(f"[Reaper] Killed a stray {name} process {pid} ({age / 60:.0f} minutes old).")
+    return killed
+
+
+def collect_orphan_files(directories: Iterable[str], referenced: set[str], grace: float, logger=None) -> tuple[int, int]:
+    """
+    Deletes the files in the given directories that are not referenced, e.g. partial downloads
+    and mp3s left behind by a crash. Files modified within the grace period are kept, since they
+    may belong to a download in progress.
+
+    :param directories: The directories to clean, not recursively.
+    :param referenced: The real paths of the files that are still in use.
+    :param grace: The minimum age in seconds of an orphan file.
+    :param logger: The logger to report deletions to.
+    :return: (number of files deleted, number of bytes freed)
+    """
+    deleted, freed = 0, 0
+    now = time.time()
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if now - stat.st_mtime < grace or os.path.realpath(entry.path) in referenced:
+                    continue
+                os.remove(entry.path)
+            except OSError:
+                continue
+            deleted += 1
+            freed += stat.st_size
+            if logger:
+                logger.info(f"[Reaper] Deleted the orphan file {entry.path} ({stat.st_size / 2**20:.1f} MiB).")
+    return deleted, freed
@@ -0,0 +1,176 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Hashable, Union
+
+
+class DownloadScheduler:
+    """
+    Limits how many yt-dlp downloads run at the same time.
+
+    Waiting downloads are served by priority first, then round-robin between guilds
+    and, inside a guild, round-robin between users, so that one member pasting twenty
+    links cannot starve everybody else.
+    """
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+    def __init__(self, max_concurrent: int) -> None:
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        # priority -> guild_id -> user_id -> waiting futures
+        self._waiting = {self.INTERACTIVE: OrderedDict(), self.BACKGROUND: OrderedDict()}
+        # key -> [priority, guild_id, user_id, future] of the waiting downloads that have a key, see promote
+        self._keyed: dict[Hashable, list] = {}
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=200)
+        # called with every wait, e.g. to feed a histogram
+        self.on_wait: Union[Callable[[float], None], None] = None
+
+    @asynccontextmanager
+    async def slot(self, guild_id: int, user_id: int, priority: int = BACKGROUND, key: Hashable = None):
+        """
+        Waits for a download slot and holds it for the duration of the block.
+
+        :param guild_id: The ID of the guild the download is for.
+        :param user_id: The ID of the member who requested the download.
+        :param priority: INTERACTIVE or BACKGROUND.
+        :param key: Identifies the download while it waits, for promote.
+        """
+        started = time.monotonic()
+        await self._acquire(guild_id, user_id, priority, key)
+        self._record_wait(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._wake_next()
+
+    @property
+    def waiting(self) -> int:
+        return sum(
+            len(futures)
+            for guilds in self._waiting.values()
+            for users in guilds.values()
+            for futures in users.values()
+        )
+
+    def stats(self) -> dict:
+        recent = sorted(self.recent_waits)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "waiting": self.waiting,
+            "granted": self.granted,
+            "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+            "p95_wait": recent[int(len(recent) * 0.95)] if recent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def promote(self, key: Hashable, priority: int) -> bool:
+        """
+        Moves a waiting download to a higher priority, e.g. when an interactive request
+        joins a background download of the same song. Returns whether it was waiting.
+
+        :param key: The key the download was given to slot.
+        :param priority: The new priority.
+        """
+        waiter = self._keyed.get(key)
+        if waiter is None or waiter[3].done() or waiter[0] <= priority:
+            return False
+        old_priority, guild_id, user_id, future = waiter
+        self._discard(old_priority, guild_id, user_id, future)
+        self._enqueue(priority, guild_id, user_id, future)
+        waiter[0] = priority
+        return True
+
+    async def _acquire(self, guild_id: int, user_id: int, priority: int, key: Hashable = None) -> None:
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(priority, guild_id, user_id, future)
+        waiter = [priority, guild_id, user_id, future]
+        if key is not None:
+            self._keyed[key] = waiter
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over right before the cancellation
+                self.active -= 1
+                self._wake_next()
+            else:
+                # waiter[0] is the priority it was promoted to, if any
+                self._discard(waiter[0], guild_id, user_id, future)
+            raise
+        finally:
+            if key is not None and self._keyed.get(key) is waiter:
+                del self._keyed[key]
+
+    def _enqueue(self, priority: int, guild_id: int, user_id: int, future: asyncio.Future) -> None:
+        users = self._waiting[priority].setdefault(guild_id, OrderedDict())
+        users.setdefault(user_id, deque()).append(future)
+
+    def _wake_next(self) -> None:
+        while self.active < self.max_concurrent:
+            future = self._pop_next()
+            if future is None:
+                return
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    def _pop_next(self):
+        for priority in (self.INTERACTIVE, self.BACKGROUND):
+            guilds = self._waiting[priority]
+            if not guilds:
+                continue
+            guild_id, users = next(iter(guilds.items()))
+            user_id, futures = next(iter(users.items()))
+            future = futures.popleft()
+            # rotate both levels so the next pick goes to another user and another guild
+            if futures:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            if users:
+                guilds.move_to_end(guild_id)
+            else:
+                del guilds[guild_id]
+            return future
+        return None
+
+    def _discard(self, priority: int, guild_id: int, user_id: int, future: asyncio.Future) -> None:
+        users = self._waiting[priority].get(guild_id)
+        if users is None or user_id not in users:
+            return
+        try:
+            users[user_id].remove(future)
+        except ValueError:
+            return
+        if not users[user_id]:
+            del users[user_id]
+        if not users:
+            del self._waiting[priority][guild_id]
+
+    def _record_wait(self, wait: float) -> None:
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+        if self.on_wait is not None:
+            self.on_wait(wait)
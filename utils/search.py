@@ -0,0 +1,76 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import time
+from collections import OrderedDict
+from typing import Union
+
+
+class SearchCache:
+    """
+    The video IDs found for recent search queries, so that repeated and popular queries,
+    and the autocomplete of every keystroke after them, need no new yt-dlp extraction.
+
+    Only the IDs are kept here, the titles and durations of the results live in the MetadataStore.
+    Queries are compared case and whitespace insensitively, and expire after ttl seconds.
+    """
+
+    def __init__(self, ttl: float, max_queries: int = 1000) -> None:
+        self.ttl = ttl
+        self.max_queries = max_queries
+        # normalized query -> (fetched_at, video IDs), least recently used first
+        self.entries: OrderedDict[str, tuple[float, tuple[str, ...]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get(self, query: str) -> Union[tuple[str, ...], None]:
+        """
+        Returns the video IDs found for a query if it was searched recently.
+
+        :param query: The search query.
+        """
+        key = self.normalize(query)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, query: str, video_ids: tuple[str, ...]) -> None:
+        key = self.normalize(query)
+        self.entries[key] = (time.time(), tuple(video_ids))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_queries:
+            self.entries.popitem(last=False)
+
+    def complete(self, prefix: str, limit: int) -> list[str]:
+        """
+        Returns the results of the cached queries that start with a prefix, most recent queries first,
+        as a stand-in while the prefix itself has not been searched yet.
+
+        :param prefix: The text typed so far.
+        :param limit: The maximum number of video IDs.
+        """
+        prefix = self.normalize(prefix)
+        now = time.time()
+        video_ids = []
+        for key, (fetched_at, ids) in reversed(self.entries.items()):
+            if not key.startswith(prefix) or now - fetched_at > self.ttl:
+                continue
+            video_ids.extend(video_id for video_id in ids if video_id not in video_ids)
+            if len(video_ids) >= limit:
+                break
+        return video_ids[:limit]
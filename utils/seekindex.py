@@ -0,0 +1,111 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import bisect
+import struct
+from array import array
+from typing import Union
+
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+OPUS_SAMPLE_RATE = 48000  # opus granule positions always count 48 kHz samples
+
+
+class OggSeekIndex:
+    """
+    Maps playback positions to the byte offsets of the Ogg pages of an Ogg/Opus file,
+    so that playback can start anywhere without demuxing, let alone decoding, what comes before.
+    """
+
+    __slots__ = ("header_size", "times", "offsets")
+
+    def __init__(self, header_size: int, times: array, offsets: array) -> None:
+        self.header_size = header_size  # the OpusHead and OpusTags pages
+        self.times = times  # the position at which the audio of each page starts, in seconds
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, path: str) -> Union["OggSeekIndex", None]:
+        """
+        Reads the page headers of an Ogg/Opus file, skipping the page bodies.
+        Returns None if the file is not a single Ogg/Opus stream.
+
+        :param path: The path of the file.
+        """
+        times, offsets = array("d"), array("q")
+        header_size = None
+        pre_skip = 0
+        previous_granule = 0
+        with open(path, "rb") as file:
+            offset = 0
+            while True:
+                header = file.read(OGG_PAGE_HEADER.size)
+                if len(header) < OGG_PAGE_HEADER.size:
+                    break
+                capture, _, _, granule, _, _, _, segments = OGG_PAGE_HEADER.unpack(header)
+                if capture != b"OggS":
+                    return None
+                body_size = sum(file.read(segments))
+                if offset == 0:
+                    body = file.read(body_size)
+                    if not body.startswith(b"OpusHead") or len(body) < 12:
+                        return None
+                    pre_skip = struct.unpack_from("<H", body, 10)[0]
+                else:
+                    file.seek(body_size, 1)
+
+                if granule > 0:
+                    if header_size is None:
+                        header_size = offset
+                    # the first packets of a page start where the previous page ended
+                    times.append(max(previous_granule - pre_skip, 0) / OPUS_SAMPLE_RATE)
+                    offsets.append(offset)
+                    previous_granule = granule
+                offset = file.tell()
+
+        if header_size is None:
+            return None
+        return cls(header_size, times, offsets)
+
+    def locate(self, seconds: float) -> tuple[int, float]:
+        """
+        Returns the byte offset of the last page starting at or before seconds, and the position
+        at which that page starts.
+
+        :param seconds: The position to seek to.
+        """
+        index = max(bisect.bisect_right(self.times, seconds) - 1, 0)
+        return self.offsets[index], self.times[index]
+
+
+class OggSlice:
+    """
+    A file-like view of an Ogg/Opus file made of its header pages followed by everything
+    from a page offset onwards, which ffmpeg reads as a valid stream starting at that page.
+    """
+
+    def __init__(self, path: str, header_size: int, offset: int) -> None:
+        self.file = open(path, "rb")
+        self.header_left = header_size
+        self.offset = offset
+
+    def read(self, size: int = -1) -> bytes:
+        if self.file.closed:
+            return b""
+        if self.header_left:
+            data = self.file.read(self.header_left if size < 0 else min(size, self.header_left))
+            self.header_left -= len(data)
+            if not self.header_left:
+                self.file.seek(self.offset)
+            return data
+        data = self.file.read(size)
+        if not data:
+            self.file.close()
+        return data
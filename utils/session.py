@@ -0,0 +1,94 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+from typing import Callable, Union
+
+
+class SessionStore:
+    """
+    Write-behind persistence of the playback session of every guild (voice channel, current song,
+    position and queue), so that a restart can pick up where it left off.
+
+    Callers only mark a guild as changed, which is a set insertion. A background task takes the
+    snapshots of the marked guilds after a short delay, so that bursts of changes coalesce into a
+    single write, and saves them in one transaction. Playback never waits for the database.
+    """
+
+    def __init__(
+        self, snapshot: Callable[[int], Union[tuple, None]], interval: float = 5.0, database=None, logger=None
+    ) -> None:
+        """
+        :param snapshot: Returns the session row of a guild, or None if it has nothing worth resuming.
+        :param interval: The delay in seconds between a change and its write.
+        :param database: The database manager.
+        :param logger: The logger to report failed writes to.
+        """
+        self.snapshot = snapshot
+        self.interval = interval
+        self.database = database
+        self.logger = logger
+        self._dirty: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Union[asyncio.Task, None] = None
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """
+        Stops the background task and writes what is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def load(self) -> list:
+        if self.database is None:
+            return []
+        return await self.database.get_player_sessions()
+
+    def mark(self, guild_id: int) -> None:
+        """
+        Schedules the session of a guild to be saved (or deleted) with the next batch.
+
+        :param guild_id: The ID of the guild.
+        """
+        self._dirty.add(guild_id)
+        self._wakeup.set()
+
+    async def flush(self) -> None:
+        if not self._dirty or self.database is None:
+            self._dirty.clear()
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows, deleted = [], []
+        for guild_id in dirty:
+            row = self.snapshot(guild_id)
+            if row is None:
+                deleted.append((guild_id,))
+            else:
+                rows.append(row)
+        try:
+            await self.database.save_player_sessions(rows, deleted)
+        except Exception as e:
+            # retried with the next batch
+            self._dirty |= dirty
+            if self.logger:
+                self.logger.error(f"[SessionStore] Failed to save {len(dirty)} sessions: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,41 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the work and
+    every caller that arrives while it is in flight awaits the same result.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs work() unless a call for the same key is already in flight, and returns its result.
+
+        :param key: The key identifying the work, e.g. a video ID.
+        :param work: A function returning the coroutine to run.
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(work())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # one caller giving up must not cancel the work for everybody else
+        return await asyncio.shield(future)
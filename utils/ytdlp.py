@@ -0,0 +1,154 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import Callable, NamedTuple, Union
+
+# the fields of an info dict that the bot uses, everything else stays in yt-dlp
+RESULT_FIELDS = ("id", "title", "duration", "filepath", "filesize", "filesize_approx", "acodec", "url")
+PROGRESS_FIELDS = ("status", "downloaded_bytes", "total_bytes", "total_bytes_estimate", "speed", "eta")
+
+RESULT_PREFIX = "[result] "
+PROGRESS_PREFIX = "[progress] "
+
+
+class YtDlpResult(NamedTuple):
+    id: str
+    title: Union[str, None]
+    duration: Union[float, None]
+    filepath: Union[str, None]  # None when nothing was downloaded
+    filesize: Union[int, None]
+    codec: Union[str, None]
+    url: Union[str, None]  # the direct media url of the selected format, or the video url of a playlist entry
+    entries: tuple = ()  # the flat entries of a playlist
+
+    @classmethod
+    def from_info(cls, info: dict) -> "YtDlpResult":
+        return cls(
+            id=info["id"],
+            title=info.get("title"),
+            duration=info.get("duration"),
+            filepath=info.get("filepath"),
+            filesize=info.get("filesize") or info.get("filesize_approx"),
+            codec=info.get("acodec"),
+            url=info.get("url"),
+            entries=tuple(cls.from_info(entry) for entry in info.get("entries") or () if entry),
+        )
+
+
+class YtDlpProgress(NamedTuple):
+    downloaded_bytes: int
+    total_bytes: Union[int, None]
+    speed: Union[float, None]
+    eta: Union[int, None]
+
+    @classmethod
+    def from_info(cls, progress: dict) -> "YtDlpProgress":
+        return cls(
+            downloaded_bytes=progress.get("downloaded_bytes") or 0,
+            total_bytes=progress.get("total_bytes") or progress.get("total_bytes_estimate"),
+            speed=progress.get("speed"),
+            eta=progress.get("eta"),
+        )
+
+    @property
+    def fraction(self) -> Union[float, None]:
+        if not self.total_bytes:
+            return None
+        return min(self.downloaded_bytes / self.total_bytes, 1.0)
+
+
+def structured_output_args(when: str = "after_move") -> list[str]:
+    """
+    Returns the yt-dlp CLI arguments that make it print one JSON progress line per update
+    and one JSON result line, instead of its human readable log.
+
+    :param when: The stage at which the result is printed, "after_move" once the final file
+        is in place, or "video" to only resolve the info without downloading.
+    """
+    fields = ",".join(RESULT_FIELDS)
+    args = ["--print", f"{when}:{RESULT_PREFIX}%(.{{{fields}}})j"]
+    if when != "video":
+        progress_fields = ",".join(PROGRESS_FIELDS)
+        args += [
+            "--progress",
+            "--newline",
+            "--progress-template", f"download:{PROGRESS_PREFIX}%(progress.{{{progress_fields}}})j",
+        ]
+    return args
+
+
+async def run_cli(
+    command: list[str],
+    on_progress: Union[Callable[[YtDlpProgress], None], None] = None,
+    timeout: float = 600,
+    logger=None,
+) -> Union[YtDlpResult, None]:
+    """
+    Runs a yt-dlp command built with structured_output_args and reads its output as a stream.
+    Only the last lines of stderr are kept, so memory stays bounded however verbose yt-dlp is.
+
+    :param command: The yt-dlp command.
+    :param on_progress: Called with every progress update.
+    :param timeout: The number of seconds after which yt-dlp is killed.
+    :param logger: The logger to report failures to.
+    """
+    results = await _run(command, on_progress, timeout, logger)
+    return results[-1] if results else None
+
+
+async def run_cli_entries(command: list[str], timeout: float = 600, logger=None) -> Union[tuple, None]:
+    """
+    Like run_cli, but returns every printed result, e.g. one per entry of a flat playlist.
+
+    :param command: The yt-dlp command.
+    :param timeout: The number of seconds after which yt-dlp is killed.
+    :param logger: The logger to report failures to.
+    """
+    results = await _run(command, None, timeout, logger)
+    return tuple(results) if results is not None else None
+
+
+async def _run(command: list[str], on_progress, timeout: float, logger) -> Union[list[YtDlpResult], None]:
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_tail = deque(maxlen=20)
+    results = []
+
+    async def read_stdout() -> None:
+        async for raw_line in process.stdout:
+            line = raw_line.decode(errors="replace").strip()
+            if line.startswith(RESULT_PREFIX):
+                results.append(YtDlpResult.from_info(json.loads(line[len(RESULT_PREFIX):])))
+            elif line.startswith(PROGRESS_PREFIX) and on_progress is not None:
+                on_progress(YtDlpProgress.from_info(json.loads(line[len(PROGRESS_PREFIX):])))
+
+    async def read_stderr() -> None:
+        async for raw_line in process.stderr:
+            stderr_tail.append(raw_line.decode(errors="replace").rstrip())
+
+    try:
+        await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr(), process.wait()), timeout=timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        process.kill()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        if logger:
+            logger.error(f"[yt-dlp] Timed out: {command[1]}")
+        return None
+
+    if process.returncode != 0:
+        if logger:
+            logger.error(f"[yt-dlp] Failed: {command[1]}\n" + "\n".join(stderr_tail))
+        return None
+    return results
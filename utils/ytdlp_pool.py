@@ -0,0 +1,208 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Union
+
+from utils.ytdlp import YtDlpProgress, YtDlpResult
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+WORKER_SCRIPT = os.path.join(ROOT_DIR, "utils", "ytdlp_worker.py")
+
+
+class _Worker:
+    __slots__ = ("process", "jobs")
+
+    def __init__(self, process: asyncio.subprocess.Process) -> None:
+        self.process = process
+        self.jobs = 0
+
+    async def stop(self) -> None:
+        if self.process.returncode is not None:
+            return
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            self.kill()
+
+    def kill(self) -> None:
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+class YtDlpWorkerPool:
+    """
+    A pool of long-lived processes with yt-dlp already imported (see utils/ytdlp_worker.py),
+    so that a request only pays for the extraction and the download instead of a fresh
+    interpreter per yt-dlp call. Jobs and results are exchanged as JSON lines over the pipes.
+
+    Workers are recycled after max_jobs jobs or once their peak RSS exceeds max_rss_mb.
+    Jobs waiting for a worker are served by priority, then in arrival order, so that
+    interactive extractions do not queue behind background downloads.
+    """
+
+    def __init__(self, size: int, max_jobs: int = 50, max_rss_mb: int = 512, logger=None) -> None:
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_kb = max_rss_mb * 1024
+        self.logger = logger
+        self._idle: list[_Worker] = []
+        # (priority, arrival, future) of the jobs waiting for a worker, the future gets None once the pool is closed
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._workers: list[_Worker] = []
+        self._closed = False
+        self.max_wait = 0.0
+
+    async def start(self) -> None:
+        for _ in range(self.size):
+            await self._add_worker()
+
+    async def close(self) -> None:
+        self._closed = True
+        self._idle.clear()
+        # wake up the jobs waiting for a worker, see run
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_result(None)
+        self._waiters.clear()
+        workers, self._workers = self._workers, []
+        await asyncio.gather(*(worker.stop() for worker in workers))
+
+    @property
+    def pids(self) -> list[int]:
+        return [worker.process.pid for worker in self._workers]
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def run(
+        self,
+        url: str,
+        options: dict,
+        download: bool = True,
+        timeout: float = 600,
+        on_progress: Union[Callable[[YtDlpProgress], None], None] = None,
+        priority: int = 1,
+    ) -> Union[YtDlpResult, None]:
+        """
+        Runs YoutubeDL.extract_info in a worker and returns its result, or None on failure
+        or once the pool is closed.
+
+        :param url: The url to extract.
+        :param options: The YoutubeDL options (must be JSON serializable).
+        :param download: Whether to download the media or only extract the info.
+        :param timeout: The number of seconds after which the job fails, waiting for a worker included.
+            A job that already runs is killed with its worker.
+        :param on_progress: Called with every progress update of the download.
+        :param priority: Lower values get a worker first, e.g. DownloadScheduler.INTERACTIVE.
+        """
+        if self._closed:
+            return None
+        started = time.monotonic()
+        try:
+            worker = await self._acquire(priority, timeout)
+        except asyncio.TimeoutError:
+            if self.logger:
+                self.logger.error(f"[yt-dlp pool] No worker for <{url}> within {timeout:.0f}s")
+            return None
+        if worker is None:
+            return None
+        try:
+            job = {"url": url, "options": options, "download": download}
+            worker.process.stdin.write((json.dumps(job) + "\n").encode())
+            await worker.process.stdin.drain()
+            remaining = max(timeout - (time.monotonic() - started), 0.0)
+            reply = await asyncio.wait_for(self._read_reply(worker, on_progress), timeout=remaining)
+        except (asyncio.TimeoutError, asyncio.CancelledError, EOFError, OSError, ValueError) as e:
+            # the worker is in an unknown state, replace it
+            worker.kill()
+            await self._replace(worker)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            if self.logger:
+                self.logger.error(f"[yt-dlp pool] Job for <{url}> failed: {type(e).__name__}")
+            return None
+
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs or reply["rss_kb"] >= self.max_rss_kb:
+            if self.logger:
+                self.logger.info(f"[yt-dlp pool] Recycling worker {worker.process.pid} after {worker.jobs} jobs.")
+            asyncio.get_running_loop().create_task(worker.stop())
+            await self._replace(worker)
+        else:
+            self._release(worker)
+
+        if "error" in reply:
+            if self.logger:
+                self.logger.error(f"[yt-dlp pool] <{url}>: {reply['error']}")
+            return None
+        return YtDlpResult.from_info(reply["result"])
+
+    async def _acquire(self, priority: int, timeout: float) -> Union[_Worker, None]:
+        started = time.monotonic()
+        if self._idle:
+            # an idle worker means that every live waiter has been served already
+            return self._idle.pop()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            worker = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # the worker may have been handed over just as the wait ended
+            if future.done() and not future.cancelled() and future.result() is not None:
+                self._release(future.result())
+            raise
+        self.max_wait = max(self.max_wait, time.monotonic() - started)
+        return worker
+
+    def _release(self, worker: _Worker) -> None:
+        if self._closed:
+            return
+        self._idle.append(worker)
+        while self._idle and self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # timed out or cancelled
+                future.set_result(self._idle.pop())
+
+    async def _read_reply(self, worker: _Worker, on_progress) -> dict:
+        while True:
+            line = await worker.process.stdout.readline()
+            if not line:
+                raise EOFError("worker exited")
+            message = json.loads(line)
+            if "progress" not in message:
+                return message
+            if on_progress is not None:
+                on_progress(YtDlpProgress.from_info(message["progress"]))
+
+    async def _add_worker(self) -> None:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT,
+            cwd=ROOT_DIR,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        worker = _Worker(process)
+        self._workers.append(worker)
+        self._release(worker)
+
+    async def _replace(self, worker: _Worker) -> None:
+        if worker in self._workers:
+            self._workers.remove(worker)
+        if not self._closed:
+            await self._add_worker()
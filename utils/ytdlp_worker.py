@@ -0,0 +1,77 @@
+""""
+Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
+
+Version: 6.1.0
+
+Modified by z4kky - https://github.com/z4kkyy
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+
+# started by path rather than with -m (see YtDlpWorkerPool), so that the utils package, and discord
+# with it, is never imported: utils/ytdlp.py only needs the standard library and is imported on its own,
+# from the directory of this file, which is then taken off sys.path so that it shadows nothing
+from ytdlp import PROGRESS_FIELDS, RESULT_FIELDS
+
+del sys.path[0]
+
+PROGRESS_INTERVAL = 1.0
+
+
+def main() -> None:
+    """
+    Serves yt-dlp jobs read as JSON lines from stdin. Every job is answered with any number
+    of {"progress": ...} lines followed by exactly one {"result": ...} or {"error": ...} line.
+    yt-dlp stays imported and one YoutubeDL object is kept per option set between jobs.
+    """
+    # keep the real stdout for the protocol and send everything else (yt-dlp, ffmpeg) to stderr
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    import yt_dlp
+
+    last_progress = 0.0
+
+    def progress_hook(progress: dict) -> None:
+        nonlocal last_progress
+        now = time.monotonic()
+        if progress.get("status") == "downloading" and now - last_progress < PROGRESS_INTERVAL:
+            return
+        last_progress = now
+        channel.write(json.dumps({"progress": {field: progress.get(field) for field in PROGRESS_FIELDS}}) + "\n")
+
+    instances = {}
+    for line in sys.stdin:
+        job = json.loads(line)
+        key = json.dumps(job["options"], sort_keys=True)
+        ydl = instances.get(key)
+        if ydl is None:
+            options = {**job["options"], "progress_hooks": [progress_hook]}
+            if isinstance(options.get("match_filter"), str):
+                # callables do not survive JSON, the filter comes as a --match-filter expression
+                options["match_filter"] = yt_dlp.utils.match_filter_func(options["match_filter"])
+            ydl = instances[key] = yt_dlp.YoutubeDL(options)
+        try:
+            info = ydl.extract_info(job["url"], download=job["download"])
+            downloads = info.get("requested_downloads") or []
+            # filepath is updated by yt-dlp to the post-processed file
+            info["filepath"] = downloads[0].get("filepath") if downloads else None
+            result = {field: info.get(field) for field in RESULT_FIELDS}
+            if info.get("entries") is not None:
+                # flat playlist extraction
+                result["entries"] = [
+                    {field: entry.get(field) for field in RESULT_FIELDS} for entry in info["entries"] if entry
+                ]
+            reply = {"result": result}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        reply["rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        channel.write(json.dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    main()